@@ -0,0 +1,228 @@
+"""Synthetic result pages for the benchmarks.
+
+All pages are generated from markup that's modelled after the selectors of the
+extractors, with deterministic random data, so the results are comparable across runs
+and commits. The pages in `fixtures/` are generated as well (see `write_fixtures`) and
+are only stored, so they don't change with this module.
+
+None of them are recorded from the real sites. They measure the speed of parsing and
+extracting, but can't tell whether the extractors still work with the real markup.
+"""
+
+import os
+import random
+from datetime import date, datetime, timedelta
+
+fixtures_dir = os.path.join(os.path.dirname(__file__), "fixtures")
+
+districts = [
+    "Altona",
+    "Eimsbüttel",
+    "Winterhude",
+    "Barmbek-Süd",
+    "Eppendorf",
+    "Ottensen",
+    "St. Georg",
+    "Hamm",
+    "Wandsbek",
+    "Harburg",
+    "Bramfeld",
+    "Lurup",
+]
+
+titles = [
+    "Helle {rooms}-Zimmer-Wohnung mit Balkon",
+    "Schöne Altbauwohnung in {district}",
+    "Moderne Neubauwohnung, {size} m², Einbauküche",
+    "Ruhige Wohnung im Grünen",
+    "Nachmieter gesucht: {rooms} Zimmer in {district}",
+    "Möbliert: Wohnung auf Zeit in {district}",
+    "Tausch: {rooms} Zimmer gegen größere Wohnung",
+    "Erstbezug nach Sanierung",
+]
+
+descriptions = [
+    "Die Wohnung befindet sich im 2. OG eines gepflegten Mehrfamilienhauses.",
+    "Zentrale Lage, gute Anbindung an den ÖPNV, Einkaufsmöglichkeiten in der Nähe.",
+    "Hochwertige Ausstattung mit Parkett, Fußbodenheizung und großem Balkon.",
+    "Ideal für Familien, Kita und Schule fußläufig erreichbar.",
+    "",
+]
+
+providers = ["Privater Anbieter", "Immobilien Hansa GmbH", "SAGA Unternehmensgruppe"]
+
+
+def read_fixture(name: str) -> str:
+    """Read a stored, generated result page."""
+    with open(os.path.join(fixtures_dir, name), encoding="utf-8") as file_descriptor:
+        return file_descriptor.read()
+
+
+def offer_data(rng: random.Random, index: int, posted: datetime | None = None) -> dict:
+    """Generate the data of a single offer.
+
+    Offers are posted a few minutes after each other, unless `posted` is given.
+    """
+    rooms = rng.choice([2, 3, 3, 4, 5])
+    size = round(rng.uniform(45, 140), 1)
+    district = rng.choice(districts)
+    if posted is None:
+        posted = datetime(2024, 1, 15, 20, 0) - timedelta(minutes=7 * index)
+
+    return {
+        "id": f"{rng.getrandbits(40):010x}",
+        "ad_id": 2600000000 + rng.randrange(10**8),
+        "rooms": rooms,
+        "size": size,
+        "price": rng.randrange(700, 2400),
+        "district": district,
+        "title": rng.choice(titles).format(rooms=rooms, size=size, district=district),
+        "description": rng.choice(descriptions),
+        "provider": rng.choice(providers),
+        "posted": posted,
+    }
+
+
+def kleinanzeigen_id(data: dict) -> str:
+    """The id Kleinanzeigen offers are known by, which is the last part of their link."""
+    return f"{data['ad_id']}-203-9409"
+
+
+def _navigation(rng: random.Random) -> str:
+    """Some markup around the results, as real pages are mostly made of that."""
+    links = "\n".join(
+        f'<li><a href="/kategorie/{rng.getrandbits(24):06x}">Kategorie {index}</a></li>'
+        for index in range(150)
+    )
+    script = "var tracking = {" + ",".join(f'"k{i}": {i}' for i in range(300)) + "};"
+    return f"<nav><ul>{links}</ul></nav><script>{script}</script>"
+
+
+def _format_price(price: int) -> str:
+    return f"{price:,}".replace(",", ".")
+
+
+def immowelt_item(data: dict) -> str:
+    return f"""
+<div class="EstateItem-1c115" data-test="estate-item">
+  <a href="https://www.immowelt.de/expose/{data["id"]}" id="{data["id"]}">
+    <div class="Gallery-0ab8e"><img src="https://media.immowelt.org/{data["id"]}.jpg" alt=""></div>
+    <div class="FactsMain-bb891">
+      <div class="KeyFacts-efbce">
+        <div data-test="price">{_format_price(data["price"])} €</div>
+        <div data-test="area">{data["size"]} m²</div>
+        <div data-test="rooms">{data["rooms"]} Zi.</div>
+      </div>
+      <h2>{data["title"]}</h2>
+      <div>
+        <div>
+          <div class="IconFact-e8a23"><i>location</i><span>Hamburg ({data["district"]})</span></div>
+          <div class="IconFact-e8a23"><i>check</i><span>Balkon, Einbauküche, ...</span></div>
+        </div>
+      </div>
+    </div>
+    <div class="ProviderName-d8e0a"><span>{data["provider"]}</span></div>
+  </a>
+</div>"""
+
+
+def immowelt_page(offers: list[dict], seed: int = 0) -> str:
+    """Render an Immowelt search page with the given offers."""
+    rng = random.Random(seed)
+    items = "".join(immowelt_item(data) for data in offers)
+    return f"""<!DOCTYPE html>
+<html lang="de"><head><meta charset="utf-8"><title>Wohnungen mieten in Hamburg</title></head>
+<body>
+<header>{_navigation(rng)}</header>
+<main><div class="SearchList-22b2e"><div class="SearchResults-606eb">{items}
+</div></div></main>
+<footer>{_navigation(rng)}</footer>
+</body></html>"""
+
+
+def kleinanzeigen_item(data: dict, today: date) -> str:
+    posted = data["posted"]
+    if posted.date() == today:
+        time = f"Heute, {posted:%H:%M}"
+    elif posted.date() == today - timedelta(days=1):
+        time = f"Gestern, {posted:%H:%M}"
+    else:
+        time = f"{posted:%d.%m.%Y}"
+
+    slug = data["title"].lower().replace(" ", "-")
+    href = f"/s-anzeige/{slug}/{kleinanzeigen_id(data)}"
+    return f"""
+<li class="ad-listitem lazyload-item">
+  <article class="aditem" data-adid="{data["ad_id"]}" data-href="{href}">
+    <div class="aditem-image"><a href="{href}"><div class="imagebox srpimagebox"></div></a></div>
+    <div class="aditem-main">
+      <div class="aditem-main--top">
+        <div class="aditem-main--top--left">22767 Hamburg {data["district"]}</div>
+        <div class="aditem-main--top--right">{time}</div>
+      </div>
+      <div class="aditem-main--middle">
+        <h2 class="text-module-begin">
+          <a class="ellipsis" href="{href}">{data["title"]}&#8203;</a>
+        </h2>
+        <p class="aditem-main--middle--description">{data["description"]}</p>
+        <div class="aditem-main--middle--price-shipping">
+          <p class="aditem-main--middle--price-shipping--price">{_format_price(data["price"])} €</p>
+        </div>
+      </div>
+      <div class="aditem-main--bottom">
+        <p class="text-module-end">
+          <span class="simpletag">{data["size"]} m²</span>
+          <span class="simpletag">{data["rooms"]} Zi.</span>
+        </p>
+      </div>
+    </div>
+  </article>
+</li>"""
+
+
+def kleinanzeigen_page(offers: list[dict], seed: int = 0, today: date | None = None) -> str:
+    """Render a Kleinanzeigen search page with the given offers.
+
+    Offers of `today` and the day before are shown with a relative date.
+    """
+    rng = random.Random(seed)
+    if today is None:
+        today = offers[0]["posted"].date() if len(offers) > 0 else date.today()
+    items = "".join(kleinanzeigen_item(data, today) for data in offers)
+    # Kleinanzeigen mixes some list items into the results, that aren't offers.
+    advertisement = '<li class="is-topad"><div class="liberty-ad">Anzeige</div></li>'
+    return f"""<!DOCTYPE html>
+<html lang="de"><head><meta charset="utf-8"><title>Wohnung mieten in Hamburg</title></head>
+<body>
+<header>{_navigation(rng)}</header>
+<div class="l-container-row contentbox-unpadded no-bg">
+<ul id="srchrslt-adtable" class="itemlist">{advertisement}{items}</ul>
+</div>
+<footer>{_navigation(rng)}</footer>
+</body></html>"""
+
+
+def generate_offers(count: int, seed: int = 0) -> list[dict]:
+    """Generate the offers of a result page, newest first."""
+    rng = random.Random(seed)
+    return [offer_data(rng, index) for index in range(count)]
+
+
+def generate_page(site: str, count: int, seed: int = 0) -> str:
+    """Generate a search page of a site with `count` offers."""
+    offers = generate_offers(count, seed)
+    if site == "immowelt":
+        return immowelt_page(offers, seed)
+
+    return kleinanzeigen_page(offers, seed)
+
+
+def write_fixtures() -> None:
+    """Write the stored pages with a realistic page size."""
+    pages = {
+        "immowelt.html": generate_page("immowelt", 20),
+        "kleinanzeigen.html": generate_page("kleinanzeigen", 25),
+    }
+    for name, text in pages.items():
+        with open(os.path.join(fixtures_dir, name), "w", encoding="utf-8") as file_descriptor:
+            file_descriptor.write(text)
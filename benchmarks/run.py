@@ -0,0 +1,548 @@
+#!/bin/env python
+"""Offline benchmarks of the scrape pipeline.
+
+Everything runs against generated pages, no network access is needed. They follow the
+markup the extractors expect, but aren't recorded from the real sites (see `fixtures`).
+Each benchmark reports the best time of several repeats and the peak memory of a
+single run. Results can be saved as json and compared to a previous run, e.g. of
+another commit:
+
+    python -m benchmarks.run run --json before.json
+    git checkout other-branch
+    python -m benchmarks.run run --compare before.json
+"""
+
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+import tracemalloc
+from collections.abc import Callable
+from dataclasses import replace
+
+import typer
+
+from benchmarks import fixtures
+from notifier import config as config_module
+from notifier import history as history_module
+from notifier import known_keys as known_keys_module
+from notifier.apartments import immowelt, kleinanzeigen
+from notifier.apartments.duplicates import DuplicateIndex
+from notifier.apartments.offer import Apartment
+from notifier.apartments.parsing import lxml_available, make_soup, take_new_offers
+from notifier.apartments.profiles import ProfileIndex, SearchProfile
+from notifier.apartments.scam import ScamScorer
+from notifier.history import OfferHistory
+from notifier.known_keys import KnownKeys
+
+cli = typer.Typer()
+
+sites = {
+    "immowelt": immowelt,
+    "kleinanzeigen": kleinanzeigen,
+}
+
+
+class Result:
+    """The measurements of a single benchmark."""
+
+    name: str
+    # The best time of a single call in seconds.
+    seconds: float
+    # The amount of items, e.g. offers or lookups, that're handled by a single call.
+    items: int
+    # The peak of allocated memory during a single call in bytes.
+    peak_memory: int
+
+    def __init__(self, name: str, seconds: float, items: int, peak_memory: int):
+        self.name = name
+        self.seconds = seconds
+        self.items = items
+        self.peak_memory = peak_memory
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "seconds": self.seconds,
+            "items": self.items,
+            "peak_memory": self.peak_memory,
+        }
+
+
+def measure(name: str, function: Callable[[], object], items: int, repeat: int) -> Result:
+    """Time a function and record its peak memory usage."""
+    timer = timeit.Timer(function)
+    # Run often enough to get a meaningful measurement for fast functions.
+    number, _ = timer.autorange()
+    seconds = min(timer.repeat(repeat=repeat, number=number)) / number
+
+    tracemalloc.start()
+    function()
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return Result(name, seconds, items, peak_memory)
+
+
+def backends() -> list[str]:
+    if lxml_available:
+        return ["html.parser", "lxml"]
+    return ["html.parser"]
+
+
+def pages(site: str, sizes: list[int]) -> list[tuple[str, str]]:
+    """The stored page and generated pages of the given sizes for a site."""
+    result = [("fixture", fixtures.read_fixture(f"{site}.html"))]
+    result += [(str(size), fixtures.generate_page(site, size)) for size in sizes]
+    return result
+
+
+def bench_pages(sizes: list[int], repeat: int) -> list[Result]:
+    """Parsing, extraction, filtering and formatting of result pages."""
+    results = []
+    for site, module in sites.items():
+        for size, text in pages(site, sizes):
+            offers = module.parse_offers(text, "html.parser")
+            count = len(offers)
+
+            for backend in backends():
+                results.append(
+                    measure(
+                        f"parse/{site}/{size}/{backend}",
+                        lambda text=text, backend=backend: module.parse_offers(text, backend),
+                        count,
+                        repeat,
+                    )
+                )
+
+            # Only the extraction, without building the tree.
+            soup = make_soup(text, backends()[-1])
+            results.append(
+                measure(
+                    f"extract/{site}/{size}",
+                    lambda soup=soup: take_new_offers(
+                        module.iter_items(soup), module.extract_offer, frozenset(), None
+                    ),
+                    count,
+                    repeat,
+                )
+            )
+
+            # A page that only contains known offers stops after a few of them.
+            known_ids = frozenset(offer.id for offer in offers)
+            results.append(
+                measure(
+                    f"parse_known/{site}/{size}/{backends()[-1]}",
+                    lambda text=text, known_ids=known_ids: module.parse_offers(
+                        text, backends()[-1], known_ids, 5
+                    ),
+                    count,
+                    repeat,
+                )
+            )
+
+            # Offers cache their derived values, so fresh copies are used each time.
+            results.append(
+                measure(
+                    f"filter/{site}/{size}",
+                    lambda offers=offers: [replace(offer).rejection_reason() for offer in offers],
+                    count,
+                    repeat,
+                )
+            )
+            results.append(
+                measure(
+                    f"format/{site}/{size}",
+                    lambda offers=offers: [replace(offer).format() for offer in offers],
+                    count,
+                    repeat,
+                )
+            )
+
+    return results
+
+
+def bench_known_keys(sizes: list[int], repeat: int) -> list[Result]:
+    """Lookups in and loading of the known keys at realistic sizes."""
+    results = []
+    lookups = 10_000
+    for size in sizes:
+        keys = [f"{index:012d}" for index in range(size)]
+
+        def fill(keys=keys) -> KnownKeys:
+            known_keys = KnownKeys()
+            for key in keys:
+                known_keys.add_key("Immowelt", key)
+            known_keys.pending = {}
+            return known_keys
+
+        results.append(measure(f"known_keys/fill/{size}", fill, size, 1))
+        known_keys = fill()
+
+        # Half of the lookups hit, the other half miss.
+        step = max(1, size // (lookups // 2))
+        probes = keys[::step][: lookups // 2]
+        probes += [f"missing-{index}" for index in range(lookups - len(probes))]
+        results.append(
+            measure(
+                f"known_keys/has_key/{size}",
+                lambda known_keys=known_keys, probes=probes: [
+                    known_keys.has_key("Immowelt", key) for key in probes
+                ],
+                len(probes),
+                repeat,
+            )
+        )
+
+        # Loading all keys from the database on startup.
+        with tempfile.TemporaryDirectory() as directory:
+            known_keys_module.known_ids_path = os.path.join(directory, "known_ids.sqlite")
+            known_keys.pending = {("Immowelt", key): 0.0 for key in keys}
+            known_keys.write_to_disk()
+            known_keys.close()
+
+            loader = KnownKeys()
+            results.append(measure(f"known_keys/load/{size}", loader.read_from_disk, size, 1))
+            loader.close()
+
+    return results
+
+
+def bench_duplicates(sizes: list[int], repeat: int) -> list[Result]:
+    """Lookups of offers from another site in a duplicate index of the given sizes."""
+    results = []
+    lookups = 1000
+    for size in sizes:
+        offers = [
+            Apartment(
+                id=data["id"],
+                link="",
+                source=source,
+                title=data["title"],
+                location=f"Hamburg {data['district']}",
+                price=data["price"],
+                size=data["size"],
+            )
+            for source, count, seed in [("Immowelt", size, 0), ("Kleinanzeigen", lookups, 1)]
+            for data in fixtures.generate_offers(count, seed)
+        ]
+        indexed, probes = offers[:size], offers[size:]
+
+        def fill(indexed=indexed) -> DuplicateIndex:
+            index = DuplicateIndex(window=24 * 60 * 60)
+            for offer in indexed:
+                index.add(offer, 0)
+            return index
+
+        results.append(measure(f"duplicates/fill/{size}", fill, size, 1))
+        index = fill()
+        results.append(
+            measure(
+                f"duplicates/find/{size}",
+                lambda index=index, probes=probes: [index.find(replace(offer)) for offer in probes],
+                len(probes),
+                repeat,
+            )
+        )
+
+    return results
+
+
+def bench_profiles(sizes: list[int], repeat: int) -> list[Result]:
+    """Matching offers against the numeric criteria of many profiles."""
+    results = []
+    offers = kleinanzeigen.parse_offers(
+        fixtures.generate_page("kleinanzeigen", 200), backends()[-1]
+    )
+    for size in sizes:
+        rng = random.Random(0)
+        profiles = [
+            SearchProfile(
+                {
+                    "site": "Kleinanzeigen",
+                    "chat_id": index,
+                    "max_price": rng.randrange(800, 2500),
+                    "min_size": rng.choice([None, rng.randrange(30, 100)]),
+                    "min_rooms": rng.choice([None, 2, 3, 4]),
+                    "max_price_per_sqm": rng.choice([None, rng.randrange(10, 25)]),
+                }
+            )
+            for index in range(size)
+        ]
+        index = ProfileIndex(profiles)
+        results.append(
+            measure(
+                f"profiles/candidates/{size}",
+                lambda index=index: [index.candidates(offer) for offer in offers],
+                len(offers),
+                repeat,
+            )
+        )
+        results.append(
+            measure(
+                f"profiles/linear/{size}",
+                lambda profiles=profiles: [
+                    [profile for profile in profiles if profile.range_rejection(offer) is None]
+                    for offer in offers
+                ],
+                len(offers),
+                repeat,
+            )
+        )
+
+    return results
+
+
+def bench_history(sizes: list[int], repeat: int) -> list[Result]:
+    """Batched writes to and aggregate queries over offer histories of the given sizes."""
+    results = []
+    batch = 1000
+    # A year of offers, spread over both sites.
+    start = time.time() - 365 * 24 * 60 * 60
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            history_module.history_path = os.path.join(directory, "history.sqlite")
+            history = OfferHistory()
+
+            offers = [
+                Apartment(
+                    id=data["id"],
+                    link="",
+                    source=["Immowelt", "Kleinanzeigen"][index % 2],
+                    title=data["title"],
+                    location=f"Hamburg ({data['district']})",
+                    price=data["price"],
+                    size=data["size"],
+                    rooms=data["rooms"],
+                )
+                for index, data in enumerate(fixtures.generate_offers(batch))
+            ]
+
+            def write(offers=offers, history=history) -> None:
+                history.add(offers)
+                history.write_to_disk()
+
+            results.append(measure(f"history/write/{size}", write, batch, 1))
+
+            # Fill the rest directly, as the first seen times need to be spread.
+            connection = history.connect()
+            with connection:
+                connection.execute("DELETE FROM offers")
+                connection.executemany(
+                    "INSERT INTO offers VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        (
+                            offer.source,
+                            f"{index}",
+                            offer.title,
+                            offer.location,
+                            offer.district,
+                            offer.link,
+                            offer.price,
+                            offer.size,
+                            offer.rooms,
+                            offer.price_per_sqm,
+                            None,
+                            start + index * 365 * 24 * 60 * 60 / size,
+                            start + index * 365 * 24 * 60 * 60 / size + 3600 * (index % 100),
+                            index % 50 == 0,
+                            "",
+                        )
+                        for index in range(size)
+                        for offer in [offers[index % batch]]
+                    ),
+                )
+
+            last_month = time.time() - 30 * 24 * 60 * 60
+            queries = {
+                "district/month": {"group_by": "district", "since": last_month},
+                "district/all": {"group_by": "district"},
+                "month/all": {"group_by": "month", "source": "Immowelt"},
+                "day/district": {"group_by": "day", "district": "Altona", "since": last_month},
+            }
+            for name, options in queries.items():
+                results.append(
+                    measure(
+                        f"history/{name}/{size}",
+                        lambda history=history, options=options: history.aggregate(**options),
+                        1,
+                        repeat,
+                    )
+                )
+            history.close()
+
+    return results
+
+
+def bench_scam(sizes: list[int], repeat: int) -> list[Result]:
+    """Scoring batches of offers against baselines seeded with the given amounts of prices."""
+    results = []
+    offers = kleinanzeigen.parse_offers(
+        fixtures.generate_page("kleinanzeigen", 200), backends()[-1]
+    )
+    for size in sizes:
+        prices = [
+            (data["district"], data["price"] / data["size"])
+            for data in fixtures.generate_offers(size, seed=1)
+        ]
+        results.append(measure(f"scam/seed/{size}", lambda: ScamScorer().seed(prices), size, 1))
+
+        scorer = ScamScorer()
+        scorer.seed(prices)
+        results.append(
+            measure(
+                f"scam/score/{size}",
+                lambda scorer=scorer: scorer.score(offers),
+                len(offers),
+                repeat,
+            )
+        )
+
+    return results
+
+
+def bench_startup(sizes: list[int], repeat: int) -> list[Result]:
+    """Startup of fresh interpreters for the bot and the commands that don't run it.
+
+    Interpreters start with empty caches of the own modules, but with compiled bytecode.
+    """
+    results = []
+    # The commands use the same throwaway config and don't see any local data.
+    config_dir = os.path.dirname(config_module.config_path)
+    environment = dict(os.environ, NOTIFIER_CONFIG=config_module.config_path, HOME=config_dir)
+    commands = {
+        "python": ["-c", "pass"],
+        "import_bot": ["-c", "import notifier.bot"],
+        "help": ["main.py", "--help"],
+        "history": ["main.py", "history"],
+    }
+    for name, arguments in commands.items():
+        results.append(
+            measure(
+                f"startup/{name}",
+                lambda arguments=arguments: subprocess.run(
+                    [sys.executable, *arguments],
+                    env=environment,
+                    cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                    capture_output=True,
+                    check=True,
+                ),
+                1,
+                repeat,
+            )
+        )
+
+    return results
+
+
+def git_commit() -> str | None:
+    try:
+        output = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+    return output.stdout.strip()
+
+
+def format_size(size: float) -> str:
+    for unit in ["B", "KiB", "MiB"]:
+        if size < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GiB"
+
+
+def print_results(results: list[Result], baseline: dict[str, dict]) -> None:
+    typer.echo(f"{'benchmark':<45} {'time':>12} {'items/s':>12} {'peak memory':>12}")
+    for result in results:
+        line = (
+            f"{result.name:<45} {result.seconds * 1000:>9.3f} ms "
+            f"{result.items / result.seconds:>12.0f} {format_size(result.peak_memory):>12}"
+        )
+        if result.name in baseline:
+            change = result.seconds / baseline[result.name]["seconds"]
+            line += f"  {change:>5.2f}x"
+        typer.echo(line)
+
+
+@cli.command()
+def run(
+    page_sizes: str = typer.Option("100,500", help="Sizes of the generated pages."),
+    key_sizes: str = typer.Option("10000,100000,1000000", help="Amounts of known keys."),
+    duplicate_sizes: str = typer.Option("10000,50000", help="Sizes of the duplicate index."),
+    profile_sizes: str = typer.Option("100,2000", help="Amounts of search profiles."),
+    scam_sizes: str = typer.Option("10000,1000000", help="Amounts of prices in the baselines."),
+    history_sizes: str = typer.Option("100000,1000000", help="Amounts of offers in the history."),
+    repeat: int = typer.Option(5, help="How often each benchmark is repeated."),
+    only: str = typer.Option("", help="Only run benchmarks whose name contains this."),
+    json_path: str = typer.Option("", "--json", help="Write the results to this file."),
+    compare: str = typer.Option("", help="Compare to the results in this file."),
+):
+    """Run all benchmarks."""
+    # The benchmarks of each group and the prefixes of their names.
+    groups = [
+        (bench_pages, page_sizes, ["parse", "extract", "filter", "format"]),
+        (bench_known_keys, key_sizes, ["known_keys"]),
+        (bench_duplicates, duplicate_sizes, ["duplicates"]),
+        (bench_profiles, profile_sizes, ["profiles"]),
+        (bench_scam, scam_sizes, ["scam"]),
+        (bench_history, history_sizes, ["history"]),
+        # Startup doesn't depend on any sizes.
+        (bench_startup, "", ["startup"]),
+    ]
+    selected = [group for group in groups if any(only.startswith(name) for name in group[2])]
+    if only == "" or len(selected) == 0:
+        selected = groups
+
+    results = []
+    # Run with the default config, regardless of the local one.
+    with tempfile.TemporaryDirectory(prefix="notifier_bench_") as config_dir:
+        config_module.config_path = os.path.join(config_dir, "config.toml")
+        open(config_module.config_path, "w").close()
+        config_module.load_config()
+
+        for bench, sizes, _ in selected:
+            results += bench([int(size) for size in sizes.split(",") if size], repeat)
+    results = [result for result in results if only in result.name]
+
+    baseline = {}
+    if compare:
+        with open(compare) as file_descriptor:
+            baseline = {result["name"]: result for result in json.load(file_descriptor)["results"]}
+
+    print_results(results, baseline)
+
+    if json_path:
+        with open(json_path, "w") as file_descriptor:
+            json.dump(
+                {
+                    "commit": git_commit(),
+                    "python": platform.python_version(),
+                    "platform": platform.platform(),
+                    "created_at": time.time(),
+                    "results": [result.to_dict() for result in results],
+                },
+                file_descriptor,
+                indent=2,
+            )
+
+
+@cli.command()
+def generate():
+    """Regenerate the stored pages."""
+    fixtures.write_fixtures()
+    typer.echo(f"Wrote fixtures to {fixtures.fixtures_dir}")
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,393 @@
+"""Run the whole bot against local stand-ins of the portals and the telegram Bot API.
+
+The fake portal renders synthetic search pages for all sites from generated offers,
+the same way the benchmark pages are generated (see `fixtures`). Its listings start
+with a page worth of offers and new offers are injected at random times. Responses are
+delayed and some of them fail or are rate limited. The fake Bot API accepts all
+messages and tells us when an injected offer has been notified about.
+
+This measures the pipeline end to end: how many notifications per second get out,
+how long it takes from an offer showing up until its notification is sent, and how
+much the event loop lags behind. The stand-ins run in the bot's event loop, so their
+(small) amount of work is part of the measured lag.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import random
+import re
+import tempfile
+import time
+from collections import Counter
+from collections.abc import Awaitable, Callable
+from datetime import date, datetime
+from http import HTTPStatus
+from urllib.parse import parse_qs, urlsplit
+
+import httpx
+import typer
+
+from benchmarks import fixtures
+from notifier import history, known_keys
+from notifier.bot import init_telegram, post_init, post_shutdown, post_stop
+from notifier.config import config
+from notifier.http_client import use_transport
+
+Response = tuple[int, dict[str, str], bytes]
+Handler = Callable[[str, str, dict[str, str], bytes], Awaitable[Response]]
+
+# Matches the id of an offer in a notification.
+notified_id_pattern = re.compile(r"`#([^`]+)`")
+
+
+class Report:
+    """Everything that's observed during a run."""
+
+    def __init__(self) -> None:
+        self.started_at = time.monotonic()
+        self.duration = 0.0
+        # The status codes of all portal responses.
+        self.responses: Counter[int] = Counter()
+        self.injected = 0
+        # All sent messages and the notifications about injected offers in them.
+        self.messages = 0
+        self.notified = 0
+        self.rejected_messages = 0
+        self.latencies: list[float] = []
+        self.loop_lags: list[float] = []
+
+    def finish(self) -> None:
+        self.duration = time.monotonic() - self.started_at
+
+    def print(self) -> None:
+        responses = ", ".join(
+            f"{status}: {count}" for status, count in sorted(self.responses.items())
+        )
+        typer.echo(f"Ran for {self.duration:.0f}s")
+        typer.echo(f"Portal: injected {self.injected} offers, answered {responses}")
+        typer.echo(
+            f"Telegram: {self.messages} messages with {self.notified} notifications about "
+            + f"injected offers, {self.rejected_messages} rate limited"
+        )
+        typer.echo(f"Throughput: {self.notified / self.duration:.2f} notifications/s")
+        typer.echo(f"Notification latency: {format_percentiles(self.latencies)}")
+        typer.echo(f"Event loop lag: {format_percentiles(self.loop_lags)}")
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def format_percentiles(values: list[float]) -> str:
+    if len(values) == 0:
+        return "no data"
+
+    parts = [f"p{round(q * 100)} {percentile(values, q):.3f}s" for q in (0.5, 0.9, 0.99)]
+    return ", ".join(parts) + f", max {max(values):.3f}s"
+
+
+async def serve_http(handler: Handler) -> tuple[asyncio.Server, int]:
+    """Serve a handler via a minimal HTTP/1.1 server on a random local port.
+
+    The handler is called with the method, target, headers and body of each request
+    and returns the status, headers and body of the response.
+    """
+
+    async def handle_connection(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            # Connections are kept alive, just like the real servers do.
+            while True:
+                request_line = await reader.readline()
+                if request_line == b"":
+                    break
+                method, target, _ = request_line.decode().split(" ", 2)
+
+                headers = {}
+                while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    name, _, value = line.decode().partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                body = b""
+                if "content-length" in headers:
+                    body = await reader.readexactly(int(headers["content-length"]))
+
+                status, response_headers, response_body = await handler(
+                    method, target, headers, body
+                )
+                head = [f"HTTP/1.1 {status} {HTTPStatus(status).phrase}"]
+                head += [f"{name}: {value}" for name, value in response_headers.items()]
+                head.append(f"Content-Length: {len(response_body)}")
+                writer.write(("\r\n".join(head) + "\r\n\r\n").encode() + response_body)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except asyncio.CancelledError:
+            # Open connections are cancelled, when the server shuts down.
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle_connection, "127.0.0.1", 0)
+    return server, server.sockets[0].getsockname()[1]
+
+
+class StubTransport(httpx.AsyncBaseTransport):
+    """Send all requests of the bot's http client to the fake portal.
+
+    The original host is passed along in the `X-Forwarded-Host` header.
+    """
+
+    def __init__(self, port: int) -> None:
+        self.port = port
+        self.transport = httpx.AsyncHTTPTransport(
+            limits=httpx.Limits(max_connections=config["http"]["max_connections"])
+        )
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        request.headers["X-Forwarded-Host"] = request.url.host
+        request.url = request.url.copy_with(scheme="http", host="127.0.0.1", port=self.port)
+        return await self.transport.handle_async_request(request)
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+
+class Portal:
+    """A stand-in for the search pages of all sites."""
+
+    page_size = 25
+    max_listing_size = 500
+
+    def __init__(
+        self,
+        report: Report,
+        offers_per_minute: float,
+        latency: float,
+        error_rate: float,
+        rate_limit_rate: float,
+        seed: int,
+    ) -> None:
+        self.report = report
+        self.offers_per_minute = offers_per_minute
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.rng = random.Random(seed)
+
+        # The generated offers of each site, newest first.
+        self.listings = {
+            "immowelt": fixtures.generate_offers(20),
+            "kleinanzeigen": fixtures.generate_offers(25),
+        }
+        # When each injected offer has been added by its id.
+        self.injected: dict[str, float] = {}
+
+    async def inject_offers(self) -> None:
+        """Add new offers to random sites at random times."""
+        while True:
+            await asyncio.sleep(self.rng.expovariate(self.offers_per_minute / 60))
+
+            site = self.rng.choice(list(self.listings))
+            data = fixtures.offer_data(self.rng, 0, posted=datetime.now())
+            offer_id = data["id"] if site == "immowelt" else fixtures.kleinanzeigen_id(data)
+
+            listing = self.listings[site]
+            listing.insert(0, data)
+            del listing[self.max_listing_size :]
+            self.injected[offer_id] = time.monotonic()
+            self.report.injected += 1
+
+    def page(self, site: str, target: str) -> int:
+        if site == "immowelt":
+            return int(parse_qs(urlsplit(target).query).get("sp", ["1"])[0])
+
+        match = re.search(r"/seite:(\d+)", target)
+        return 1 if match is None else int(match.group(1))
+
+    async def handle(self, method: str, target: str, headers: dict, body: bytes) -> Response:
+        if self.latency > 0:
+            await asyncio.sleep(self.rng.expovariate(1 / self.latency))
+
+        status, response_headers, response_body = self.respond(target, headers)
+        self.report.responses[status] += 1
+        return status, response_headers, response_body
+
+    def respond(self, target: str, headers: dict) -> Response:
+        roll = self.rng.random()
+        if roll < self.rate_limit_rate:
+            return 429, {"Retry-After": "60"}, b""
+        if roll < self.rate_limit_rate + self.error_rate:
+            return 500, {}, b"Internal Server Error"
+
+        site = "immowelt" if "immowelt" in headers.get("x-forwarded-host", "") else "kleinanzeigen"
+        page = self.page(site, target)
+        offers = self.listings[site][(page - 1) * self.page_size : page * self.page_size]
+        if len(offers) == 0:
+            return 404, {}, b"Not Found"
+
+        if site == "immowelt":
+            text = fixtures.immowelt_page(offers)
+        else:
+            text = fixtures.kleinanzeigen_page(offers, today=date.today())
+
+        etag = f'"{hashlib.sha1(text.encode()).hexdigest()}"'
+        if headers.get("if-none-match") == etag:
+            return 304, {"ETag": etag}, b""
+
+        return 200, {"Content-Type": "text/html; charset=utf-8", "ETag": etag}, text.encode()
+
+
+class TelegramSink:
+    """A stand-in for the telegram Bot API, that accepts all messages."""
+
+    def __init__(self, portal: Portal, report: Report, error_rate: float, seed: int) -> None:
+        self.portal = portal
+        self.report = report
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.message_id = 0
+
+    async def handle(self, method: str, target: str, headers: dict, body: bytes) -> Response:
+        api_method = target.rsplit("/", 1)[-1]
+        if headers.get("content-type", "").startswith("application/json"):
+            params = json.loads(body or b"{}")
+        else:
+            params = {key: values[0] for key, values in parse_qs(body.decode()).items()}
+
+        if api_method == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "Stub", "username": "stub_bot"}
+        elif api_method == "getUpdates":
+            # Long polling, but don't hold up the shutdown for too long.
+            await asyncio.sleep(min(float(params.get("timeout", 0)), 1))
+            result = []
+        elif api_method == "sendMessage":
+            if self.rng.random() < self.error_rate:
+                self.report.rejected_messages += 1
+                return self.response(
+                    {
+                        "ok": False,
+                        "error_code": 429,
+                        "description": "Too Many Requests: retry after 1",
+                        "parameters": {"retry_after": 1},
+                    },
+                    status=429,
+                )
+            result = self.receive(params)
+        else:
+            result = True
+
+        return self.response({"ok": True, "result": result})
+
+    def receive(self, params: dict) -> dict:
+        """Record a message and answer like telegram does."""
+        text = str(params.get("text", ""))
+        self.report.messages += 1
+        # Digests contain several offers.
+        for offer_id in notified_id_pattern.findall(text):
+            if offer_id in self.portal.injected:
+                self.report.notified += 1
+                self.report.latencies.append(time.monotonic() - self.portal.injected[offer_id])
+
+        self.message_id += 1
+        return {
+            "message_id": self.message_id,
+            "date": int(time.time()),
+            "chat": {"id": int(params.get("chat_id", 0)), "type": "channel"},
+            "text": text,
+        }
+
+    def response(self, data: dict, status: int = 200) -> Response:
+        return status, {"Content-Type": "application/json"}, json.dumps(data).encode()
+
+
+async def monitor_loop_lag(report: Report, interval: float = 0.05) -> None:
+    """Record how much later than requested the event loop wakes us up."""
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        report.loop_lags.append(time.perf_counter() - start - interval)
+
+
+def configure(directory: str, chats: int, interval: float, digest: bool) -> None:
+    """Point the bot to throwaway state and poll with profiles that accept most offers."""
+    known_keys.known_ids_path = os.path.join(directory, "known_ids.sqlite")
+    known_keys.legacy_known_ids_path = os.path.join(directory, "known_ids.toml")
+    history.history_path = os.path.join(directory, "history.sqlite")
+
+    config["telegram"].update({"api_key": "123456:stub", "target_channel": -1000})
+    config["scheduling"].update(
+        {
+            "initial_interval": interval,
+            "min_interval": interval / 4,
+            "max_interval": interval * 4,
+            "requests_per_hour": 1_000_000,
+        }
+    )
+    config["circuit_breaker"].update({"cooldown": interval * 4, "max_cooldown": interval * 16})
+    config["metrics"].update({"port": 0, "file": ""})
+    config["send_queue"]["shutdown_timeout"] = 1
+    config["digest"].update({"enabled": digest, "chats": {}})
+    config["profiles"] = [
+        {"name": f"{site} {chat}", "site": site, "chat_id": -1000 - chat}
+        for site in ["Immowelt", "Kleinanzeigen"]
+        for chat in range(chats)
+    ]
+
+
+async def run(
+    duration: float,
+    offers_per_minute: float,
+    interval: float,
+    chats: int,
+    digest: bool,
+    latency: float,
+    error_rate: float,
+    rate_limit_rate: float,
+    telegram_error_rate: float,
+    seed: int,
+) -> Report:
+    report = Report()
+    portal = Portal(report, offers_per_minute, latency, error_rate, rate_limit_rate, seed)
+    sink = TelegramSink(portal, report, telegram_error_rate, seed)
+    portal_server, portal_port = await serve_http(portal.handle)
+    telegram_server, telegram_port = await serve_http(sink.handle)
+
+    with tempfile.TemporaryDirectory() as directory:
+        configure(directory, chats, interval, digest)
+        use_transport(StubTransport(portal_port))
+        app = init_telegram(bot_api_url=f"http://127.0.0.1:{telegram_port}")
+
+        tasks = [
+            asyncio.create_task(portal.inject_offers()),
+            asyncio.create_task(monitor_loop_lag(report)),
+        ]
+        # This is what `run_polling` does, except that we stop after a fixed time.
+        await app.initialize()
+        await post_init(app)
+        await app.updater.start_polling()
+        await app.start()
+        try:
+            await asyncio.sleep(duration)
+        finally:
+            report.finish()
+            await app.updater.stop()
+            await app.stop()
+            await post_stop(app)
+            await app.shutdown()
+            await post_shutdown(app)
+
+            for task in tasks:
+                task.cancel()
+            portal_server.close()
+            telegram_server.close()
+
+    return report
+
+
+def run_stub(**options) -> None:
+    """Run the bot against the stand-ins and print what has been observed."""
+    report = asyncio.run(run(**options))
+    report.print()
@@ -1,26 +1,104 @@
 #!/bin/env python
-"""The main entry point for the bot."""
+"""The main entry point for the bot.
+
+Each command only imports what it needs, so commands that don't run the bot
+don't pay for loading telegram and the scrapers.
+"""
+import os
+import time
+
 import typer
 
-from notifier import init_telegram
+from notifier.config import MissingConfigError, load_config
 
 cli = typer.Typer()
 
 
+def load() -> None:
+    """Load the config or exit, if there's none yet."""
+    try:
+        load_config()
+    except MissingConfigError as ex:
+        typer.echo(str(ex))
+        raise typer.Exit(1)
+
+
 @cli.command()
 def run():
     """Actually start the bot."""
+    load()
+    from notifier.bot import init_telegram
+
     app = init_telegram()
     typer.echo("Starting the bot in polling mode.")
     app.run_polling()
 
 
 @cli.command()
-def stub():
-    """Actually start the bot."""
-    app = init_telegram()
-    typer.echo("Starting the bot in polling mode.")
-    app.run_polling()
+def history(
+    by: str = typer.Option("district", help="One of source, district, day, week or month."),
+    days: float = typer.Option(30, help="Only include offers of this many past days. 0 for all."),
+    source: str = typer.Option("", help="Only include offers of this site."),
+    district: str = typer.Option("", help="Only include offers of this district."),
+):
+    """Show statistics of all scraped offers."""
+    load()
+    from notifier.history import OfferHistory, groupings, history_path
+
+    if by not in groupings:
+        raise typer.BadParameter(f"Must be one of {', '.join(groupings)}", param_hint="--by")
+
+    if not os.path.exists(history_path):
+        typer.echo("No history yet.")
+        return
+
+    offer_history = OfferHistory(read_only=True)
+    rows = offer_history.aggregate(
+        group_by=by,
+        since=time.time() - days * 24 * 60 * 60 if days > 0 else None,
+        source=source or None,
+        district=district or None,
+    )
+    offer_history.close()
+
+    typer.echo(f"{by:<25} {'offers':>8} {'price':>8} {'€/m²':>8} {'scams':>8} {'listed':>8}")
+    for row in rows:
+        price_per_sqm = row["price_per_sqm"] or 0
+        typer.echo(
+            f"{row['name']!s:<25} {row['offers']:>8} {row['price']:>8.0f} "
+            + f"{price_per_sqm:>8.2f} {row['scam_rate']:>7.1%} {row['listed_hours']:>7.1f}h"
+        )
+
+
+@cli.command()
+def stub(
+    duration: float = typer.Option(120, help="How long to run in seconds."),
+    offers_per_minute: float = typer.Option(30, help="How many new offers show up."),
+    interval: float = typer.Option(10, help="The initial polling interval in seconds."),
+    chats: int = typer.Option(3, help="How many chats subscribe to each site."),
+    digest: bool = typer.Option(False, help="Combine offers into digests."),
+    latency: float = typer.Option(0.2, help="The average response time of the portals."),
+    error_rate: float = typer.Option(0.02, help="The fraction of failing portal responses."),
+    rate_limit_rate: float = typer.Option(0.01, help="The fraction of rate limited responses."),
+    telegram_error_rate: float = typer.Option(0.01, help="The fraction of rate limited messages."),
+    seed: int = typer.Option(0, help="The seed for all random decisions."),
+):
+    """Run the bot against local stand-ins of the portals and telegram to measure its throughput."""
+    load()
+    from benchmarks.stub import run_stub
+
+    run_stub(
+        duration=duration,
+        offers_per_minute=offers_per_minute,
+        interval=interval,
+        chats=chats,
+        digest=digest,
+        latency=latency,
+        error_rate=error_rate,
+        rate_limit_rate=rate_limit_rate,
+        telegram_error_rate=telegram_error_rate,
+        seed=seed,
+    )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,197 @@
+"""Detect offers that have already been notified about on another site.
+
+The same flat is often listed on several sites with slightly different titles.
+Each offer is reduced to a set of shingles (title words, location and rounded price
+and size), of which a MinHash signature is computed. The signatures are split into
+bands and offers that share any band are candidates for being duplicates
+(locality-sensitive hashing). Candidates are then compared by their actual price,
+size and shingles.
+
+Bands are additionally keyed by a price bucket, as many titles are nearly the same.
+This way a lookup only looks at a handful of candidates, no matter how many offers
+are in the index.
+"""
+import math
+import random
+import re
+import time
+import zlib
+from collections import deque
+from itertools import pairwise
+
+from .offer import Apartment
+
+# MinHash parameters. The signature has `bands * rows` values.
+# Offers whose shingles have a Jaccard similarity of `s` share a band with a
+# probability of `1 - (1 - s^rows)^bands`, which is ~80% for `s = 0.4`.
+bands = 10
+rows = 3
+_prime = (1 << 61) - 1
+_rng = random.Random(0)
+_permutations = [
+    (_rng.randrange(1, _prime), _rng.randrange(0, _prime)) for _ in range(bands * rows)
+]
+
+_word_pattern = re.compile(r"\w+")
+# Words that're in nearly every title and say nothing about the flat itself.
+_stopwords = {"in", "mit", "und", "der", "die", "das", "zimmer", "wohnung", "zi", "m²", "m2"}
+
+
+def shingles(offer: Apartment) -> frozenset[str]:
+    """Get the features of an offer that are compared between sites."""
+    title = offer.normalized_text[0]
+    words = [word for word in _word_pattern.findall(title) if word not in _stopwords]
+    features = set(words)
+    features.update(f"{first} {second}" for first, second in pairwise(words))
+
+    location = offer.normalized_text[2]
+    features.update(f"location:{word}" for word in _word_pattern.findall(location))
+
+    # Rounded a bit, as some sites round while others don't.
+    features.add(f"price:{round(offer.price / 10)}")
+    if offer.size is not None:
+        features.add(f"size:{round(offer.size)}")
+
+    return frozenset(features)
+
+
+def signature(features: frozenset[str]) -> tuple[int, ...]:
+    """Compute the MinHash signature of a set of features."""
+    hashes = [zlib.crc32(feature.encode()) for feature in features]
+    if len(hashes) == 0:
+        hashes = [0]
+
+    return tuple(min((a * value + b) % _prime for value in hashes) for a, b in _permutations)
+
+
+def similarity(first: frozenset[str], second: frozenset[str]) -> float:
+    """The Jaccard similarity of two sets of features."""
+    if len(first) == 0 and len(second) == 0:
+        return 1.0
+
+    return len(first & second) / len(first | second)
+
+
+def _close(first: float | None, second: float | None, tolerance: float) -> bool:
+    """Check whether two values differ by at most `tolerance` relative to the larger one."""
+    if first is None or second is None:
+        return True
+
+    return abs(first - second) <= tolerance * max(abs(first), abs(second))
+
+
+class Entry:
+    """An offer in the index and the chats that have been notified about it."""
+
+    key: tuple[str, str]
+    source: str
+    price: float
+    size: float | None
+    features: frozenset[str]
+    bands: list[int]
+    chats: set[int | str]
+    added_at: float
+
+    def __init__(self, offer: Apartment, features: frozenset[str], bands: list[int]) -> None:
+        self.key = (offer.source, offer.id)
+        self.source = offer.source
+        self.price = offer.price
+        self.size = offer.size
+        self.features = features
+        self.bands = bands
+        self.chats = set()
+        self.added_at = time.monotonic()
+
+
+class DuplicateIndex:
+    """An index of recently notified offers to find duplicates from other sites.
+
+    Offers are forgotten after `window` seconds.
+    """
+
+    def __init__(
+        self,
+        window: float,
+        price_tolerance: float = 0.02,
+        size_tolerance: float = 0.02,
+        min_similarity: float = 0.3,
+    ) -> None:
+        self.window = window
+        self.price_tolerance = price_tolerance
+        self.size_tolerance = size_tolerance
+        self.min_similarity = min_similarity
+
+        self.entries: dict[tuple[str, str], Entry] = {}
+        # The keys of all entries that share a band and price bucket by their hash.
+        # Most buckets hold a single entry, which is why they're lists and not sets.
+        self.buckets: dict[int, list[tuple[str, str]]] = {}
+        # All keys in the order they have been added, to expire them.
+        self.order: deque[tuple[str, str]] = deque()
+
+    def size(self) -> int:
+        """The amount of remembered offers."""
+        return len(self.entries)
+
+    def price_bucket(self, price: float) -> int:
+        """Prices within the tolerance end up in the same or neighbouring buckets."""
+        return int(math.log(max(price, 1)) / math.log(1 + max(self.price_tolerance, 0.001)))
+
+    def _bands(self, features: frozenset[str]) -> list[tuple[int, tuple[int, ...]]]:
+        values = signature(features)
+        return [(band, values[band * rows : (band + 1) * rows]) for band in range(bands)]
+
+    def find(self, offer: Apartment) -> Entry | None:
+        """Find an offer from another site that's most likely the same flat."""
+        self.expire()
+
+        features = shingles(offer)
+        price_bucket = self.price_bucket(offer.price)
+        candidates: set[tuple[str, str]] = set()
+        for band, values in self._bands(features):
+            for bucket in [price_bucket - 1, price_bucket, price_bucket + 1]:
+                candidates.update(self.buckets.get(hash((bucket, band, values)), ()))
+
+        best = None
+        best_similarity = self.min_similarity
+        for key in candidates:
+            entry = self.entries[key]
+            if entry.source == offer.source:
+                continue
+            if not _close(entry.price, offer.price, self.price_tolerance):
+                continue
+            if not _close(entry.size, offer.size, self.size_tolerance):
+                continue
+
+            entry_similarity = similarity(entry.features, features)
+            if entry_similarity >= best_similarity:
+                best = entry
+                best_similarity = entry_similarity
+
+        return best
+
+    def add(self, offer: Apartment, chat_id: int | str) -> None:
+        """Remember that a chat has been notified about an offer."""
+        key = (offer.source, offer.id)
+        entry = self.entries.get(key)
+        if entry is None:
+            features = shingles(offer)
+            price_bucket = self.price_bucket(offer.price)
+            keys = [hash((price_bucket, band, values)) for band, values in self._bands(features)]
+            entry = Entry(offer, features, keys)
+            self.entries[key] = entry
+            self.order.append(key)
+            for band in entry.bands:
+                self.buckets.setdefault(band, []).append(key)
+
+        entry.chats.add(chat_id)
+
+    def expire(self) -> None:
+        """Forget all offers that have been added before the window."""
+        threshold = time.monotonic() - self.window
+        while len(self.order) > 0 and self.entries[self.order[0]].added_at < threshold:
+            entry = self.entries.pop(self.order.popleft())
+            for band in entry.bands:
+                bucket = self.buckets[band]
+                bucket.remove(entry.key)
+                if len(bucket) == 0:
+                    del self.buckets[band]
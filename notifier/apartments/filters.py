@@ -0,0 +1,167 @@
+import re
+
+forbidden_words = [
+    "tausch",
+    "wohnungsswap",
+    "mitbewohn",
+    "untermiete",
+    "zwischenmiete",
+    "möbliert",
+    "gesucht",
+]
+
+forbidden_areas = [
+    "altengamme",
+    "allermöhe",
+    "bramfeld",
+    "blankenese",
+    "curslack",
+    "dockenhuden",
+    "duvenstedt",
+    "finkenwerder",
+    "fischbek",
+    "hausbruch",
+    "hochkamp",
+    "hummelsbüttel",
+    "iserbrook",
+    "jenfeld",
+    "langenbek",
+    "lohbrügge",
+    "neugraben",
+    "kirchwerder",
+    "ochsenwerder",
+    "lurup",
+    "marmstorf",
+    "meiendorf",
+    "neuengamme",
+    "neuenfelde",
+    "rahlstedt",
+    "reitbrook",
+    "rellingen",
+    "rönneburg",
+    "sasel",
+    "sinstorf",
+    "spadenland",
+    "süldorf",
+    "schnelsen",
+    "tatenberg",
+    "tonndorf",
+    "volksdorf",
+    # Harburg area
+    "bostelbek",
+    "eissendorf",
+    "eißendorf",
+    "harburg",
+    "heimfeld",
+    "wilstorf",
+]
+
+
+# The names of all rules that may reject an offer.
+# Rejection reasons start with the rule's name, followed by details.
+# Rules that start with the name of another rule have to come first.
+rules = [
+    "TOO OLD",
+    "TOO EXPENSIVE PER M²",
+    "TOO EXPENSIVE",
+    "TOO SMALL",
+    "TOO LARGE",
+    "TOO FEW ROOMS",
+    "TOO MANY ROOMS",
+    "FORBIDDEN WORD",
+    "FORBIDDEN AREA",
+]
+
+
+def reason_rule(reason: str) -> str:
+    """Get the rule of a rejection reason without its details."""
+    for rule in rules:
+        if reason.startswith(rule):
+            return rule
+
+    return reason
+
+
+def compile_terms(terms: list[str]) -> re.Pattern | None:
+    """Compile a list of terms into a single regex that matches any of them.
+
+    The terms are arranged as a trie, so common prefixes are only checked once
+    and each text is scanned a single time, no matter how many terms there are.
+    """
+    trie: dict = {}
+    for term in terms:
+        term = term.lower()
+        if term == "":
+            continue
+
+        node = trie
+        for char in term:
+            node = node.setdefault(char, {})
+        # The empty key marks the end of a term
+        node[""] = {}
+
+    if len(trie) == 0:
+        return None
+
+    return re.compile(_trie_to_regex(trie))
+
+
+def _trie_to_regex(node: dict) -> str:
+    """Recursively convert a trie node into a regex pattern."""
+    alternatives = []
+    is_end = False
+    for char, child in sorted(node.items()):
+        if char == "":
+            is_end = True
+            continue
+        alternatives.append(re.escape(char) + _trie_to_regex(child))
+
+    if len(alternatives) == 0:
+        return ""
+
+    if len(alternatives) == 1 and not is_end:
+        return alternatives[0]
+
+    pattern = "(?:" + "|".join(alternatives) + ")"
+    # A term ends here, the longer terms are optional.
+    if is_end:
+        pattern += "?"
+
+    return pattern
+
+
+class FilterEngine:
+    """Check offers against lists of forbidden words and areas.
+
+    All lists are compiled once on creation. Checking an offer scans each field a
+    single time per list. Offers cache their lowercased text, so checking the same
+    offer against several engines doesn't lowercase it again.
+    """
+
+    def __init__(self, words: list[str], areas: list[str]) -> None:
+        self.word_pattern = compile_terms(words)
+        self.area_pattern = compile_terms(areas)
+
+    def check_normalized(self, title: str, description: str, location: str) -> str | None:
+        """Return the reason why an offer is rejected or `None` if it passes.
+
+        The text must already be lowercased, see `Apartment.normalized_text`.
+        """
+        # Filter offers that contain forbidden words in their title or description
+        if self.word_pattern is not None:
+            for text in [title, description]:
+                match = self.word_pattern.search(text)
+                if match is not None:
+                    return f"FORBIDDEN WORD {match.group()}"
+
+        # Filter areas that're unsuitable for us
+        if self.area_pattern is not None:
+            for text in [title, description, location]:
+                match = self.area_pattern.search(text)
+                if match is not None:
+                    return f"FORBIDDEN AREA {match.group()}"
+
+        return None
+
+
+default_filter = FilterEngine(forbidden_words, forbidden_areas)
@@ -1,45 +1,78 @@
-import requests
-from bs4 import BeautifulSoup
-from telegram.ext import CallbackContext
+import re
+from collections.abc import Iterator
+from typing import TYPE_CHECKING
+from urllib.parse import parse_qsl, urlencode, urlsplit
 
 from notifier.logging import logger
-from notifier.notify import send_apartment_offers
-
-from .offer import Apartment
-
-headers = {
-    "Accept": (
-        "text/html;charset=utf-8,"
-        + "application/xhtml+xml;charset=utf-8,"
-        + "application/xml;q=0.9;charset=utf-8,"
-        + "image/avif,image/webp,*/*;q=0.8"
-    ),
-    "Accept-Encoding": "gzip",
-    "Accept-Language": "en-US,en;q=0.5",
-    "Connection": "keep-alive",
-    "Host": "www.immowelt.de",
-    "Upgrade-Insecure-Requests": "1",
-    "User-Agent": "Mozilla/5.0 (X11; Linux x86_64; rv:109.0) Gecko/20100101 Firefox/117.0",
-}
-
-
-async def scrape_immowelt(context: CallbackContext) -> None:
-    """Scrape Immowelt and send regular updates on new events."""
-
-    # Load the side with the our current search criteria
-    url = (
-        "https://www.immowelt.de/suche/hamburg/wohnungen/mieten"
-        + "?ami=65&d=true&pma=1500&rmi=3&sd=DESC&sf=TIMESTAMP&sp=1"
-    )
-    response = requests.get(url, headers=headers)
-    if response.status_code != 200:
-        logger.warn(f"Got response with status code {response.status_code}")
-
-    # Immowelt sends no encoding information. We rely on an educated guess
-    response.encoding = response.apparent_encoding
-
-    soup = BeautifulSoup(response.text, "html.parser")
 
+from .offer import Apartment, parse_number
+from .parsing import make_soup, take_new_offers
+from .profiles import SearchProfile
+from .registry import register_scraper
+
+if TYPE_CHECKING:
+    from bs4 import Tag
+
+# Matches the ids of all offers on a search page.
+# The list of ids is a cheap way to detect whether the page changed at all.
+# Offer links look like `https://www.immowelt.de/expose/2abc3d4`.
+offer_id_pattern = re.compile(r"/expose/([\w-]+)")
+
+
+def build_url(profile: SearchProfile) -> str:
+    """Build the search url for the criteria of a profile."""
+    if profile.url is not None:
+        return profile.url
+
+    params = {}
+    if profile.min_size is not None:
+        params["ami"] = profile.min_size
+    params["d"] = "true"
+    if profile.max_price is not None:
+        params["pma"] = profile.max_price
+    if profile.min_rooms is not None:
+        params["rmi"] = profile.min_rooms
+    if profile.max_rooms is not None:
+        params["rma"] = profile.max_rooms
+    # Always sort by newest offers first
+    params["sd"] = "DESC"
+    params["sf"] = "TIMESTAMP"
+    params["sp"] = 1
+
+    return f"https://www.immowelt.de/suche/{profile.city}/wohnungen/mieten?{urlencode(params)}"
+
+
+def page_url(url: str, page: int) -> str:
+    """Get the url of a specific result page. Immowelt uses the `sp` parameter for this."""
+    parts = urlsplit(url)
+    params = dict(parse_qsl(parts.query))
+    params["sp"] = str(page)
+
+    return parts._replace(query=urlencode(params)).geturl()
+
+
+@register_scraper("Immowelt", build_url, page_url, offer_id_pattern)
+def parse_offers(
+    text: str,
+    backend: str,
+    known_ids: frozenset[str] = frozenset(),
+    stop_after: int | None = None,
+) -> list[Apartment]:
+    """Parse a search page and extract all new offers.
+
+    This runs in a worker process.
+    """
+    # Immowelt sends no encoding information.
+    # The shared client relies on an educated guess in that case.
+    soup = make_soup(text, backend)
+    return take_new_offers(iter_items(soup), extract_offer, known_ids, stop_after)
+
+
+def iter_items(soup) -> Iterator[tuple[str, "Tag"]]:
+    """Lazily find all offers and their ids in the order they're listed on the page.
+
+    The offers themselves are only extracted, once we know they're new.
+    """
     # Find the element that contains all offers
     container = soup.select('div[class*="SearchResults-"]')
     if len(container) == 0:
@@ -53,87 +86,79 @@ async def scrape_immowelt(context: CallbackContext) -> None:
         logger.error("Failed to get list of offers from container. Please investigate.")
         return
 
-    # Iterate through all offers and extract all interesting information.
-    offers = []
     for raw_offer in offer_items:
-        try:
-            offer = extract_offer_details(raw_offer)
+        # The offer is a single large link, whose last part is the id of the offer.
+        link = raw_offer.find("a")
+        if link is None or "href" not in link.attrs:
+            continue
 
-            # There're some list items that aren't offers
-            if offer is None:
-                continue
+        yield link.attrs["href"].split("/")[-1], raw_offer
 
-            offers.append(offer)
-        except Exception as ex:
-            logger.error(f"Got exception {ex} for the following block:")
-            logger.error(raw_offer.prettify())
 
-            raise ex
+def extract_offer(raw_offer: "Tag") -> Apartment | None:
+    """Extract all interesting information of an offer."""
+    try:
+        return extract_offer_details(raw_offer)
+    except Exception as ex:
+        logger.error(f"Got exception {ex} for the following block:")
+        logger.error(raw_offer.prettify())
 
-    await send_apartment_offers(context.bot, offers)
+        raise ex
 
 
 def extract_offer_details(raw_offer) -> Apartment | None:
-    offer = Apartment()
-    offer.source = "Immowelt"
-    # There's no time info on offers from immowelt
-    offer.raw_time = "vor ca. 5min"
-    offer.time = None
-
     # The offer is a single large link, which contains all other infos.
     link = raw_offer.find("a")
 
     # Get the link for this offer
-    offer.link = link.attrs["href"]
-
-    # The id of the offer is the very last item of the link
-    offer.id = offer.link.split("/")[-1]
+    offer_link = link.attrs["href"]
 
     # All interesting information is contained in a `FactsMain` div.
     facts_main = link.select('div[class*="FactsMain-"]')[0]
 
     # Get some infos for the appartment (size, price, rooms)
     key_facts = facts_main.select('div[class*="KeyFacts-"] > div')
+    price = 0.0
     flat_size = None
+    rooms = None
+    key_data = []
     for child in key_facts:
         fact = child.get_text().strip()
         # Explicitly handle the price
         if child.attrs["data-test"] == "price":
             # Remove euro sign
-            price = fact.replace("€", "").strip()
+            raw_price = fact.replace("€", "").strip()
             # Remove 1.000 delimiter
-            price = price.replace(".", "")
+            raw_price = raw_price.replace(".", "")
             # Convert `,` to `.` for correct float parsing
-            price = price.replace(",", ".")
+            raw_price = raw_price.replace(",", ".")
 
-            offer.price = float(price)
+            price = float(raw_price)
             continue
 
-        # Extract the flat size which is formatted as `124.2 m²`.
+        # Extract the flat size which is formatted as `124.2 m²` and the rooms as `3 Zi.`.
         if "m²" in fact:
-            flat_size = float(fact.split(" ")[0])
-
-        offer.key_data.append(fact)
+            flat_size = parse_number(fact)
+        elif child.attrs["data-test"] == "rooms":
+            rooms = parse_number(fact)
 
-    # Get the title for the offer
-    offer.title = facts_main.find("h2").get_text().strip()
+        key_data.append(fact)
 
     # Get the estate detail wrapper
     facts = facts_main.select('div > div > div[class*="IconFact-"]')
 
+    location = ""
+    equipment = []
     for fact in facts:
         fact_name = fact.find("i").get_text().strip()
         fact_text = fact.find("span").get_text().strip()
         if fact_name == "location":
-            offer.location = fact_text
+            location = fact_text
         elif fact_name == "check":
             # Get the list of equipment. Filter out the `...` item.
-            equipment = fact_text.split(", ")
-            offer.equipment = list(filter(lambda x: x != "...", equipment))
+            equipment = [item for item in fact_text.split(", ") if item != "..."]
 
-    # Check for scam offers.
-    # Scam offers are usually posted by private providers "Private Anbieter".
-    # Additionally, the prices for those flats are ridiculously cheap.
+    # The provider is used to detect scam offers, see `scam.py`.
     provider_info = link.select('div[class*="ProviderName-"]')
     if len(provider_info) == 0:
         logger.error("Found offer with no provider info")
@@ -142,13 +167,20 @@ def extract_offer_details(raw_offer) -> Apartment | None:
     provider_info = provider_info[0]
     provider_name = provider_info.find("span").get_text().strip()
 
-    if provider_name == "Privater Anbieter":
-        offer.scam = True
-        offer.scam_reason.append("Privater Anbieter")
-
-        if flat_size is not None:
-            price_per_qm = offer.price / flat_size
-            if price_per_qm <= 10:
-                offer.scam_reason.append("Zu günstig")
-
-    return offer
+    return Apartment(
+        # The id of the offer is the very last item of the link
+        id=offer_link.split("/")[-1],
+        link=offer_link,
+        source="Immowelt",
+        title=facts_main.find("h2").get_text().strip(),
+        location=location,
+        price=price,
+        size=flat_size,
+        rooms=rooms,
+        # There's no time info on offers from immowelt
+        time=None,
+        raw_time="vor ca. 5min",
+        key_data=tuple(key_data),
+        equipment=tuple(equipment),
+        provider=provider_name,
+    )
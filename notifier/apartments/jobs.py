@@ -0,0 +1,164 @@
+import asyncio
+import traceback
+
+from telegram.error import BadRequest, NetworkError, TimedOut
+from telegram.ext import CallbackContext, JobQueue
+
+from notifier import metrics
+from notifier.config import config
+from notifier.http_client import RateLimitedError
+from notifier.logging import logger
+from notifier.notify import send_apartment_offers
+
+# Import all scrapers, so they register themselves.
+from . import immowelt, kleinanzeigen  # noqa: F401
+from .registry import sites
+from .scheduler import ScrapeResult
+from .scraping import scrape_search
+from .searches import Search, get_searches
+
+
+def schedule_scrapers(job_queue: JobQueue) -> None:
+    """Schedule a polling job for each site.
+
+    The jobs reschedule themselves with an interval that adapts to each site.
+    """
+    for site in sites:
+        job_queue.run_once(scrape_site, when=10, data=site, name=f"Scrape {site}")
+
+
+async def scrape_site(context: CallbackContext) -> None:
+    """This is a high level wrapper around the actual scraper logic.
+
+    It scrapes all searches of a single site and schedules the next run afterwards.
+    Each distinct search is fetched once and its offers are fanned out to all profiles
+    that subscribed to it. All searches run concurrently. The search profiles are
+    reloaded if the config changed.
+
+    Sites that keep failing are stopped by their circuit breaker. While it's open,
+    the site isn't polled at all. Afterwards a single search is used as a probe.
+    The target channel is notified once when a site is stopped and once it recovered.
+    """
+    site = context.job.data
+    scheduler = context.bot_data["scheduler"]
+    breaker = scheduler.breaker(site)
+    # Shared by all sites, so it limits the scrapers overall.
+    semaphore = context.bot_data["scrape_semaphore"]
+
+    if not breaker.try_poll():
+        delay = breaker.remaining()
+        context.job_queue.run_once(scrape_site, when=delay, data=site, name=f"Scrape {site}")
+        return
+
+    result = ScrapeResult(failed=True)
+    try:
+        searches = [search for search in get_searches() if search.site.name == site]
+        if breaker.state == "half_open":
+            logger.info(f"Probing {site}")
+            searches = searches[:1]
+
+        with metrics.stage_duration.time(stage="cycle", site=site):
+            results = await asyncio.gather(
+                *[run_scraper(context, search, semaphore) for search in searches]
+            )
+
+        errors = [result.error for result in results if result.error is not None]
+        result = ScrapeResult(
+            new_offers=sum(result.new_offers for result in results),
+            requests=sum(result.requests for result in results),
+            failed=any(result.failed for result in results),
+            rate_limited=any(result.rate_limited for result in results),
+            error=errors[0] if len(errors) > 0 else None,
+        )
+    finally:
+        # Always schedule the next run, no matter what happened.
+        change = breaker.record(result)
+        if change is not None:
+            notify_breaker_change(context, site, change, result)
+
+        delay = scheduler.next_interval(site, result)
+        logger.info(f"Checking {site} again in {delay:.0f}s")
+        context.job_queue.run_once(scrape_site, when=delay, data=site, name=f"Scrape {site}")
+
+
+def notify_breaker_change(
+    context: CallbackContext,
+    site: str,
+    change: str,
+    result: ScrapeResult,
+) -> None:
+    """Tell the target channel that a site has been stopped or works again."""
+    breaker = context.bot_data["scheduler"].breaker(site)
+    if change == "opened":
+        text = (
+            f"Scraping {site} failed {breaker.failures} times in a row, "
+            + f"pausing it for {breaker.cooldown:.0f}s. Last error: {result.error}"
+        )
+        logger.error(text)
+    else:
+        text = f"Scraping {site} works again"
+        logger.info(text)
+
+    metrics.breaker_changes.inc(site=site, change=change)
+    context.bot_data["send_queue"].enqueue(
+        config["telegram"]["target_channel"],
+        text,
+        parse_mode=None,
+    )
+
+
+async def run_scraper(
+    context: CallbackContext,
+    search: Search,
+    semaphore: asyncio.Semaphore,
+) -> ScrapeResult:
+    """Run the scraper for a single search.
+
+    It's purpose is to allow easy error handling per scraper.
+    Errors are only logged and reported in the result, the circuit breaker of the
+    site decides whether they're worth a notification.
+    """
+    site = search.site.name
+    timeout = config["scraping"]["timeout"]
+    requests_before = search.requests
+    async with semaphore:
+        try:
+            logger.info(f"Checking {site}")
+            # Pages of a failed previous visit must not be skipped.
+            search.pending_pages = []
+            offers = await asyncio.wait_for(scrape_search(context, search), timeout=timeout)
+            if offers is None:
+                logger.info(f"Nothing changed on {site}")
+                return ScrapeResult(requests=search.requests - requests_before)
+
+            offers = context.bot_data["scam_scorer"].score(offers)
+            context.bot_data["history"].add(offers)
+            await send_apartment_offers(context, search, offers)
+            search.remember_pages()
+            return ScrapeResult(
+                new_offers=len(offers),
+                requests=search.requests - requests_before,
+            )
+        except RateLimitedError:
+            logger.warning(f"{site} is rate limiting us")
+            metrics.scrape_errors.inc(site=site, kind="rate_limited")
+            return ScrapeResult(
+                requests=search.requests - requests_before,
+                rate_limited=True,
+                error="Rate limited",
+            )
+        except TimeoutError:
+            error = "Timed out"
+            logger.error(f"Scraper for {site} timed out")
+            metrics.scrape_errors.inc(site=site, kind="timeout")
+        except Exception as ex:
+            error = f"{type(ex).__name__}: {ex}"
+            # Ignore telegram network errors
+            if type(ex) is TimedOut or type(ex) is NetworkError or type(ex) is BadRequest:
+                pass
+            else:
+                logger.error(f"Got exception {ex}")
+                traceback.print_exc()
+                metrics.scrape_errors.inc(site=site, kind="error")
+
+    return ScrapeResult(requests=search.requests - requests_before, failed=True, error=error)
@@ -1,50 +1,99 @@
+import re
+from collections.abc import Iterator
 from datetime import datetime, timedelta
-
-import requests
-from bs4 import BeautifulSoup
-from telegram.ext import CallbackContext
+from typing import TYPE_CHECKING
+from urllib.parse import urlsplit
 
 from notifier.logging import logger
-from notifier.notify import send_apartment_offers
-
-from .offer import Apartment
-
-headers = {
-    "Accept": (
-        "text/html;charset=utf-8,"
-        + "application/xhtml+xml;charset=utf-8,"
-        + "application/xml;q=0.9;charset=utf-8,"
-        + "image/avif,image/webp,*/*;q=0.8"
-    ),
-    "Accept-Encoding": "gzip, deflate, br",
-    "Accept-Language": "en-US,en;q=0.5",
-    "Connection": "keep-alive",
-    "Host": "www.kleinanzeigen.de",
-    "Upgrade-Insecure-Requests": "1",
-    "User-Agent": "Mozilla/5.0 (X11; Linux x86_64; rv:109.0) Gecko/20100101 Firefox/117.0",
-}
-
-
-async def scrape_kleinanzeigen(context: CallbackContext) -> None:
-    """Scrape Kleinanzeigen and send regular updates on new events."""
-
-    # Load the side with the our current search criteria
-    url = (
-        "https://www.kleinanzeigen.de/s-wohnung-mieten/hamburg/"
-        + "anzeige:angebote/preis::1600/c203l9409+"
-        + "wohnung_mieten.qm_d:65%2C+wohnung_mieten.zimmer_d:3%2C5"
-    )
-    response = requests.get(url, headers=headers)
-    if response.status_code != 200:
-        logger.warn(f"Got response with status code {response.status_code}")
 
+from .offer import Apartment, parse_number
+from .parsing import make_soup, take_new_offers
+from .profiles import SearchProfile
+from .registry import register_scraper
+
+if TYPE_CHECKING:
+    from bs4 import Tag
+
+# Matches the ids of all offers on a search page.
+# The list of ids is a cheap way to detect whether the page changed at all.
+# Offer links look like `/s-anzeige/some-title/2612345678-203-9409`.
+offer_id_pattern = re.compile(r'data-href="[^"]*/([^"/]+)"')
+
+
+def build_url(profile: SearchProfile) -> str:
+    """Build the search url for the criteria of a profile.
+
+    Kleinanzeigen encodes all criteria in the path of the url.
+    Ranges are formatted as `min,max`, where each side may be empty.
+    """
+    if profile.url is not None:
+        return profile.url
+
+    def format_range(min_value, max_value) -> str:
+        min_value = "" if min_value is None else f"{min_value:g}"
+        max_value = "" if max_value is None else f"{max_value:g}"
+        return f"{min_value}%2C{max_value}"
+
+    url = f"https://www.kleinanzeigen.de/s-wohnung-mieten/{profile.city}/anzeige:angebote/"
+    if profile.max_price is not None:
+        url += f"preis::{profile.max_price:g}/"
+
+    # The category for flats to rent, followed by the location.
+    url += f"c203{profile.location_id or ''}"
+    if profile.min_size is not None:
+        url += f"+wohnung_mieten.qm_d:{format_range(profile.min_size, None)}"
+    if profile.min_rooms is not None or profile.max_rooms is not None:
+        url += f"+wohnung_mieten.zimmer_d:{format_range(profile.min_rooms, profile.max_rooms)}"
+
+    return url
+
+
+def page_url(url: str, page: int) -> str:
+    """Get the url of a specific result page.
+
+    Kleinanzeigen adds a `seite:2` path segment in front of the price and category.
+    The first page has no such segment.
+    """
+    if page == 1:
+        return url
+
+    parts = urlsplit(url)
+    segments = parts.path.split("/")
+    position = len(segments) - 1
+    for index, segment in enumerate(segments):
+        if segment.startswith("preis:") or re.match(r"c\d+", segment):
+            position = index
+            break
+
+    segments.insert(position, f"seite:{page}")
+
+    return parts._replace(path="/".join(segments)).geturl()
+
+
+@register_scraper("Kleinanzeigen", build_url, page_url, offer_id_pattern)
+def parse_offers(
+    text: str,
+    backend: str,
+    known_ids: frozenset[str] = frozenset(),
+    stop_after: int | None = None,
+) -> list[Apartment]:
+    """Parse a search page and extract all new offers.
+
+    This runs in a worker process.
+    """
     # For some reason, there's a zero-width whitespace character inserted into
     # some text. This breaks beautiful soup, which is why we remove it.
-    text = response.text
     text = text.replace("&#8203", "")
 
-    soup = BeautifulSoup(text, "html.parser")
+    soup = make_soup(text, backend)
+    return take_new_offers(iter_items(soup), extract_offer, known_ids, stop_after)
+
+
+def iter_items(soup) -> Iterator[tuple[str, "Tag"]]:
+    """Lazily find all offers and their ids in the order they're listed on the page.
 
+    The offers themselves are only extracted, once we know they're new.
+    """
     # Find the element that contains all offers
     container = soup.select("div.l-container-row.contentbox-unpadded.no-bg")
     if len(container) == 0:
@@ -60,61 +109,52 @@ async def scrape_kleinanzeigen(context: CallbackContext) -> None:
     if offer_list is None:
         return
 
-    # Iterate through all offers and extract all interesting information.
-    offers = []
     for raw_offer in offer_list.find_all("li"):
-        try:
-            offer = extract_offer_details(raw_offer)
+        # Filter list items that aren't real offers
+        article = raw_offer.find("article")
+        if article is None:
+            continue
 
-            # There're some list items that aren't offers
-            if offer is None:
-                continue
+        # The id of the offer is the very last item of the link
+        yield article.attrs["data-href"].split("/")[-1], raw_offer
 
-            offers.append(offer)
-        except Exception as ex:
-            logger.error(f"Got exception {ex} for the following block:")
-            logger.error(raw_offer.prettify())
 
-            raise ex
+def extract_offer(raw_offer: "Tag") -> Apartment | None:
+    """Extract all interesting information of an offer."""
+    try:
+        return extract_offer_details(raw_offer)
+    except Exception as ex:
+        logger.error(f"Got exception {ex} for the following block:")
+        logger.error(raw_offer.prettify())
 
-    await send_apartment_offers(context.bot, offers)
+        raise ex
 
 
 def extract_offer_details(raw_offer) -> Apartment | None:
-    offer = Apartment()
-    offer.source = "Kleinanzeigen"
-
     # Filter list items that aren't real offers
     if raw_offer.find("article") is None:
         return None
 
     # Assemble the link for this offer
-    offer.link = (
-        "https://kleinanzeigen.de" + raw_offer.find("article").attrs["data-href"]
-    )
+    link = "https://kleinanzeigen.de" + raw_offer.find("article").attrs["data-href"]
 
-    # The id of the offer is the very last item of the link
-    offer.id = offer.link.split("/")[-1]
-    offer.location = (
-        raw_offer.find(attrs={"class": "aditem-main--top--left"}).get_text().strip()
-    )
+    location = raw_offer.find(attrs={"class": "aditem-main--top--left"}).get_text().strip()
 
     # Determine the date this offer has been created at.
-    time = raw_offer.find(attrs={"class": "aditem-main--top--right"}).get_text().strip()
-    offer.raw_time = time
-    if time == "":
-        offer.time = None
+    raw_time = raw_offer.find(attrs={"class": "aditem-main--top--right"}).get_text().strip()
+    if raw_time == "":
+        time = None
     else:
         # If there's no `:` inside the time, this is a date and older than two days.
-        if ":" not in time:
-            offer.time = datetime.strptime(time, "%d.%m.%Y")
+        if ":" not in raw_time:
+            time = datetime.strptime(raw_time, "%d.%m.%Y")
         else:
             # Parse a recent offer time, which has these two formats:
             # Gestern, 18:01
             # Heute, 12:15
 
             # Extract the date part and the hour + minute components
-            split = time.split(", ")
+            split = raw_time.split(", ")
             day = split[0]
             [hour, minute] = split[1].split(":")
 
@@ -124,18 +164,13 @@ def extract_offer_details(raw_offer) -> Apartment | None:
                 offer_date = offer_date - timedelta(days=1)
 
             # Set the time
-            offer.time = offer_date.replace(
-                hour=int(hour), minute=int(minute), second=0, microsecond=0
-            )
+            time = offer_date.replace(hour=int(hour), minute=int(minute), second=0, microsecond=0)
 
     main_content = raw_offer.find(attrs={"class": "aditem-main--middle"})
-    offer.title = main_content.find("h2").get_text().strip()
-    offer.description = (
-        raw_offer.find(attrs={"class": "aditem-main--middle--description"})
-        .get_text()
-        .strip()
+    description = (
+        raw_offer.find(attrs={"class": "aditem-main--middle--description"}).get_text().strip()
     )
-    offer.price = float(
+    price = float(
         raw_offer.find(attrs={"class": "aditem-main--middle--price-shipping--price"})
         .get_text()
         .strip()
@@ -144,8 +179,31 @@ def extract_offer_details(raw_offer) -> Apartment | None:
     )
 
     tag_items = raw_offer.find(attrs={"class": "aditem-main--bottom"})
-    offer.key_data = []
+    key_data = []
+    size = None
+    rooms = None
     for tag_item in tag_items.select("span.simpletag"):
-        offer.key_data.append(tag_item.get_text().strip())
-
-    return offer
+        tag = tag_item.get_text().strip()
+        key_data.append(tag)
+
+        # The living space is formatted as `65,5 m²` and the rooms as `3 Zi.`.
+        if tag.endswith("m²"):
+            size = parse_number(tag)
+        elif tag.endswith("Zi."):
+            rooms = parse_number(tag)
+
+    return Apartment(
+        # The id of the offer is the very last item of the link
+        id=link.split("/")[-1],
+        link=link,
+        source="Kleinanzeigen",
+        title=main_content.find("h2").get_text().strip(),
+        description=description,
+        location=location,
+        price=price,
+        size=size,
+        rooms=rooms,
+        time=time,
+        raw_time=raw_time,
+        key_data=tuple(key_data),
+    )
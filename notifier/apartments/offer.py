@@ -1,153 +1,129 @@
+import re
+from dataclasses import dataclass, field, fields
 from datetime import datetime, timedelta
 
-from notifier.logging import logger
+from .filters import FilterEngine, default_filter
 
+_number_pattern = re.compile(r"\d+(?:[.,]\d+)?")
+# E.g. `Hamburg (Altona)` or `22767 Hamburg Altona`
+_district_pattern = re.compile(r"^[^(]*\((.+)\)|^\s*(?:\d{5}\s+)?\S+\s+(.+)$")
 
+# Markdown symbols that're removed from user provided text.
+markdown_characters = ["[", "`", "*", "_"]
+markdown_translation = dict.fromkeys(map(ord, "".join(markdown_characters)), None)
+
+
+def parse_number(text: str) -> float | None:
+    """Parse the first number in a fact like `124.2 m²`, `65,5 m²` or `3 Zi.`."""
+    match = _number_pattern.search(text)
+    if match is None:
+        return None
+
+    return float(match.group().replace(",", "."))
+
+
+@dataclass(frozen=True, slots=True)
 class Apartment:
     """
     A generic representation of an apartment offer.
+
+    Offers are immutable, as they're shared between all profiles and chats.
+    Derived values, such as the normalized text and the rendered message, are
+    computed on first use and cached on the offer.
     """
 
     id: str
     link: str
     source: str
 
-    scam: bool
-    scam_reason: list[str]
-
-    title: str
-    description: str
-    time: datetime | None
-    raw_time: str
-    key_data: list[str]
-
-    location: str
-    price: float
-
-    def __init__(self):
-        """Initialize a new raw offer object."""
-
-        self.id = ""
-        self.link = ""
-        self.source = ""
-
-        self.scam = False
-        self.scam_reason = []
-
-        self.title = ""
-        self.description = ""
-        self.time = None
-        self.raw_time = ""
-        self.key_data = []
-        self.equipment = []
-
-        self.location = ""
-        self.price = 0
-
-    def is_viable(self) -> bool:
-        """Check if the current offer matches our rough criteria.
-
-        This is mostly used to filter obviously unviable offers.
-        """
-        # Don't look at offers that're older than 2 hours
+    title: str = ""
+    description: str = ""
+    location: str = ""
+    price: float = 0
+    # The living space in m² and the amount of rooms, if the site lists them.
+    size: float | None = None
+    rooms: float | None = None
+
+    time: datetime | None = None
+    raw_time: str = ""
+    key_data: tuple[str, ...] = ()
+    equipment: tuple[str, ...] = ()
+    # E.g. `Privater Anbieter`, if the site lists it.
+    provider: str = ""
+
+    scam: bool = False
+    scam_reason: tuple[str, ...] = ()
+
+    # Caches of derived values
+    _normalized: tuple[str, str, str] | None = field(
+        default=None, init=False, repr=False, compare=False
+    )
+    _price_per_sqm: float | None = field(default=None, init=False, repr=False, compare=False)
+    _district: str | None = field(default=None, init=False, repr=False, compare=False)
+    _message: str | None = field(default=None, init=False, repr=False, compare=False)
+
+    @property
+    def normalized_text(self) -> tuple[str, str, str]:
+        """The lowercased title, description and location, as used by the filters."""
+        if self._normalized is None:
+            normalized = (self.title.lower(), self.description.lower(), self.location.lower())
+            object.__setattr__(self, "_normalized", normalized)
+
+        return self._normalized
+
+    @property
+    def price_per_sqm(self) -> float | None:
+        """The price per m² or `None`, if the size is unknown."""
+        if self._price_per_sqm is None and self.size is not None and self.size != 0:
+            object.__setattr__(self, "_price_per_sqm", self.price / self.size)
+
+        return self._price_per_sqm
+
+    @property
+    def district(self) -> str:
+        """The district part of the location or the whole location, if there is none."""
+        if self._district is None:
+            match = _district_pattern.search(self.location)
+            if match is None:
+                district = self.location.strip()
+            else:
+                district = (match.group(1) or match.group(2)).strip()
+            object.__setattr__(self, "_district", district)
+
+        return self._district
+
+    def rejection_reason(self, filter: FilterEngine = default_filter) -> str | None:
+        """Return the rule that rejects this offer or `None` if it's viable."""
+        # Don't look at offers that're older than 2 days
         threshold = datetime.now() - timedelta(days=2)
         if self.time is not None:
             if self.time < threshold:
                 delta = datetime.now() - self.time
-                logger.info(f"Ignoring offer (TOO OLD {delta}) for: {self.title}")
-                return False
-
-        forbidden_words = [
-            "tausch",
-            "wohnungsswap",
-            "mitbewohn",
-            "untermiete",
-            "zwischenmiete",
-            "möbliert",
-            "gesucht",
-        ]
-
-        # Filter offers that contain forbidden words in their title or description
-        for area in forbidden_words:
-            if area in self.title.lower() or area in self.description.lower():
-                logger.info(f"Ignoring offer (FORBIDDEN WORD) for: {self.title}")
-                return False
-
-        forbidden_areas = [
-            "altengamme",
-            "allermöhe",
-            "bramfeld",
-            "blankenese",
-            "curslack",
-            "dockenhuden",
-            "duvenstedt",
-            "finkenwerder",
-            "fischbek",
-            "hausbruch",
-            "hochkamp",
-            "hummelsbüttel",
-            "iserbrook",
-            "jenfeld",
-            "langenbek",
-            "lohbrügge",
-            "neugraben",
-            "kirchwerder",
-            "ochsenwerder",
-            "lurup",
-            "marmstorf",
-            "meiendorf",
-            "neuengamme",
-            "neuenfelde",
-            "rahlstedt",
-            "reitbrook",
-            "rellingen",
-            "rönneburg",
-            "sasel",
-            "sinstorf",
-            "spadenland",
-            "süldorf",
-            "schnelsen",
-            "tatenberg",
-            "tonndorf",
-            "volksdorf",
-            # Harburg area
-            "bostelbek",
-            "eissendorf",
-            "eißendorf",
-            "harburg",
-            "heimfeld",
-            "wilstorf",
-        ]
-        # Filter areas that're unsuitable for us
-        for area in forbidden_areas:
-            if (
-                area in self.title.lower()
-                or area in self.description.lower()
-                or area in self.location.lower()
-            ):
-                logger.info(f"Ignoring offer (FORBIDDEN AREA) for: {self.title}")
-                return False
-
-        return True
-
-    def clean(self):
-        """Clean the offer from unwanted markdown symbols."""
-        markdown_characters = ["[", "`", "*", "_", "`"]
-        translation_table = dict.fromkeys(map(ord, "".join(markdown_characters)), None)
-
-        self.title = self.title.translate(translation_table)
-        self.description = self.description.translate(translation_table)
+                return f"TOO OLD {delta}"
+
+        return filter.check_normalized(*self.normalized_text)
 
     def format(self) -> str:
-        """Bring the offer into human readable format."""
-        # Clean the offer from unwanted symbols
-        self.clean()
+        """Bring the offer into human readable format.
+
+        The message is only rendered once, as it's sent to every subscribed chat.
+        """
+        if self._message is None:
+            object.__setattr__(self, "_message", self.render())
+
+        return self._message
+
+    def render(self) -> str:
+        """Render the message for this offer."""
+        # Clean the text from unwanted markdown symbols
+        title = self.title.translate(markdown_translation)
+        description = self.description.translate(markdown_translation)
 
         # Show a scam text, if the offer is a scam
         if self.scam:
             reasons = ", ".join(self.scam_reason)
             text = f"""
-[SCAM: {self.title}]({self.link})
+[SCAM: {title}]({self.link})
 Gründe: {reasons}
 """
             return text
@@ -162,13 +138,12 @@ Gründe: {reasons}
         if len(self.equipment) != 0:
             equipment = "\n" + ", ".join(self.equipment)
 
-        description = ""
-        if self.description != "":
-            description = f"\n---\n{self.description}\n"
+        if description != "":
+            description = f"\n---\n{description}\n"
 
         key_data = ", ".join(self.key_data)
         text = f"""Von {self.source}:
-[{self.title}]({self.link})
+[{title}]({self.link})
 
 #{self.id} (`#{self.id}`)
 
@@ -181,5 +156,16 @@ Gepostet: {formatted_time}
 
         return text
 
-    def __repr__(self) -> str:
-        return self.format()
+    def to_dict(self) -> dict:
+        """Get all fields as a plain dict, e.g. to store the offer."""
+        return {item.name: getattr(self, item.name) for item in fields(self) if item.init}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Apartment":
+        """Create an offer from the fields returned by `to_dict`."""
+        data = dict(data)
+        for name in ["key_data", "equipment", "scam_reason"]:
+            if name in data:
+                data[name] = tuple(data[name])
+
+        return cls(**data)
@@ -0,0 +1,117 @@
+"""Run the CPU heavy html parsing outside of the event loop.
+
+Parsing result pages is by far the most expensive step of each scrape cycle.
+It's done by a pool of worker processes, so it neither stalls the telegram handling
+nor is it limited to a single core. Workers only receive the page's text and
+return plain offer objects.
+"""
+import asyncio
+import importlib.util
+import multiprocessing
+from collections.abc import Callable, Iterable
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import TYPE_CHECKING, TypeVar
+
+from notifier.config import config
+
+from .offer import Apartment
+
+if TYPE_CHECKING:
+    from bs4 import BeautifulSoup
+
+# BeautifulSoup and lxml are only imported, once a page is parsed.
+# With the process pool, that only ever happens in the worker processes.
+lxml_available = importlib.util.find_spec("lxml") is not None
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+_executor: Executor | None = None
+
+
+def parser_backend() -> str:
+    """Get the parser backend for BeautifulSoup.
+
+    `lxml` is a lot faster than python's builtin parser and is used if it's installed.
+    """
+    backend = config["scraping"]["parser"]
+    if backend == "auto":
+        return "lxml" if lxml_available else "html.parser"
+
+    return backend
+
+
+def make_soup(text: str, backend: str) -> "BeautifulSoup":
+    """Parse a page with the given backend."""
+    from bs4 import BeautifulSoup
+
+    return BeautifulSoup(text, backend)
+
+
+def get_executor() -> Executor:
+    """Get the pool that's used for parsing. The pool is created on first use."""
+    global _executor
+    if _executor is None:
+        workers = config["scraping"]["parser_workers"]
+        if config["scraping"]["parser_pool"] == "thread":
+            _executor = ThreadPoolExecutor(max_workers=workers)
+        else:
+            # Don't fork the bot's process, as it has running threads.
+            _executor = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("forkserver"),
+            )
+
+    return _executor
+
+
+async def run_parser(parser: Callable[..., T], text: str, *args) -> T:
+    """Run a parser function for a page in the worker pool.
+
+    The parser is called with the page's text, the parser backend and all other args.
+    It must be a module level function, so it can be sent to the worker processes.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), parser, text, parser_backend(), *args)
+
+
+def take_new_offers(
+    items: Iterable[tuple[str, R]],
+    extract: Callable[[R], Apartment | None],
+    known_ids: frozenset[str],
+    stop_after: int | None,
+) -> list[Apartment]:
+    """Extract all offers that aren't known yet.
+
+    Items are the id and the raw element of each offer on a page. Only the elements
+    of new offers are passed to `extract`, which may return `None` for elements
+    that aren't offers after all.
+
+    Search pages are sorted by newest offers first. Once `stop_after` consecutive known
+    offers have been seen, all following offers are most likely known as well.
+    We stop there, which means the remaining offers aren't looked at at all.
+    A single known offer isn't enough, as pinned offers may show up between new ones.
+    """
+    new_offers = []
+    known_in_a_row = 0
+    for offer_id, item in items:
+        if offer_id not in known_ids:
+            known_in_a_row = 0
+            offer = extract(item)
+            if offer is not None:
+                new_offers.append(offer)
+            continue
+
+        known_in_a_row += 1
+        if stop_after is not None and known_in_a_row >= stop_after:
+            break
+
+    return new_offers
+
+
+def shutdown_executor() -> None:
+    """Stop all workers."""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(cancel_futures=True)
+        _executor = None
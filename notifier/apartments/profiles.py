@@ -0,0 +1,176 @@
+from bisect import bisect_left, bisect_right
+
+from notifier import metrics
+from notifier.config import config, reload_config
+from notifier.logging import logger
+
+from .filters import FilterEngine, forbidden_areas, forbidden_words, reason_rule
+from .offer import Apartment
+
+# The numeric criteria of profiles. Each is the profile's option, the offer's field it
+# limits, whether it's a lower bound and the rule that rejects offers outside of it.
+numeric_criteria = [
+    ("max_price", "price", False, "TOO EXPENSIVE"),
+    ("max_price_per_sqm", "price_per_sqm", False, "TOO EXPENSIVE PER M²"),
+    ("min_size", "size", True, "TOO SMALL"),
+    ("max_size", "size", False, "TOO LARGE"),
+    ("min_rooms", "rooms", True, "TOO FEW ROOMS"),
+    ("max_rooms", "rooms", False, "TOO MANY ROOMS"),
+]
+
+
+class SearchProfile:
+    """A single search on a site, as defined in the `profiles` section of the config.
+
+    The filters of a profile are compiled once, when the profile is created.
+    """
+
+    name: str
+    site: str
+    chat_id: int | str
+
+    # An explicit search url. If this isn't set, the site builds the url.
+    url: str | None
+    city: str
+    location_id: str | None
+
+    max_price: float | None
+    max_price_per_sqm: float | None
+    min_size: float | None
+    max_size: float | None
+    min_rooms: float | None
+    max_rooms: float | None
+
+    # The maximum amount of result pages that're checked during bursts.
+    max_pages: int
+
+    filter: FilterEngine
+    limits: list[tuple[str, bool, float, str]]
+
+    def __init__(self, options: dict):
+        """Create a profile from its config options."""
+        self.name = options.get("name", options["site"])
+        self.site = options["site"]
+        self.chat_id = options.get("chat_id", config["telegram"]["target_channel"])
+
+        self.url = options.get("url")
+        self.city = options.get("city", "hamburg")
+        self.location_id = options.get("location_id")
+
+        self.max_price = options.get("max_price")
+        self.max_price_per_sqm = options.get("max_price_per_sqm")
+        self.min_size = options.get("min_size")
+        self.max_size = options.get("max_size")
+        self.min_rooms = options.get("min_rooms")
+        self.max_rooms = options.get("max_rooms")
+
+        self.max_pages = options.get("max_pages", config["scraping"]["max_pages"])
+
+        # The numeric criteria this profile actually uses with their limits.
+        self.limits = [
+            (field, lower_bound, getattr(self, option), rule)
+            for option, field, lower_bound, rule in numeric_criteria
+            if getattr(self, option) is not None
+        ]
+
+        self.filter = FilterEngine(
+            options.get("forbidden_words", forbidden_words),
+            options.get("forbidden_areas", forbidden_areas),
+        )
+
+    def range_rejection(self, offer: Apartment) -> str | None:
+        """Check the numeric criteria of this profile.
+
+        Returns the rule that rejects the offer or `None`, if it's within all limits.
+        Values that an offer doesn't have never reject it.
+        """
+        for field, lower_bound, limit, rule in self.limits:
+            value = getattr(offer, field)
+            if value is None:
+                continue
+
+            if (value < limit) if lower_bound else (value > limit):
+                return f"{rule} {value:g}"
+
+        return None
+
+    def is_viable(self, offer: Apartment) -> bool:
+        """Check if an offer matches the criteria of this profile."""
+        reason = offer.rejection_reason(self.filter)
+        if reason is None:
+            reason = self.range_rejection(offer)
+
+        if reason is not None:
+            logger.info(f"Ignoring offer ({reason}) for: {offer.title}")
+            metrics.filtered_offers.inc(site=offer.source, rule=reason_rule(reason))
+            return False
+
+        return True
+
+    def __repr__(self) -> str:
+        return f"SearchProfile({self.name} on {self.site})"
+
+
+class ProfileIndex:
+    """An index to quickly find all profiles whose numeric criteria match an offer.
+
+    For each criterion, the profiles that use it are sorted by their limit. A binary
+    search then finds all profiles that an offer's value satisfies. Only the profiles
+    of the most selective criterion are checked against all other criteria.
+    """
+
+    def __init__(self, profiles: list[SearchProfile]):
+        self.profiles = profiles
+        # For each criterion: the offer's field, whether it's a lower bound, the sorted
+        # limits, the profiles in the same order and the profiles without that criterion.
+        self.criteria: list[tuple[str, bool, list[float], list, list]] = []
+        for option, field, lower_bound, _ in numeric_criteria:
+            limited = [profile for profile in profiles if getattr(profile, option) is not None]
+            limited.sort(key=lambda profile: getattr(profile, option))
+            limits = [getattr(profile, option) for profile in limited]
+            unlimited = [profile for profile in profiles if getattr(profile, option) is None]
+            if len(limited) > 0:
+                self.criteria.append((field, lower_bound, limits, limited, unlimited))
+
+    def candidates(self, offer: Apartment) -> list[SearchProfile]:
+        """Get all profiles whose numeric criteria match an offer."""
+        candidates = self.profiles
+        for field, lower_bound, limits, limited, unlimited in self.criteria:
+            value = getattr(offer, field)
+            if value is None:
+                continue
+
+            # Lower bounds at most the value or upper bounds at least the value.
+            if lower_bound:
+                start, end = 0, bisect_right(limits, value)
+            else:
+                start, end = bisect_left(limits, value), len(limits)
+
+            if end - start + len(unlimited) < len(candidates):
+                candidates = limited[start:end] + unlimited
+
+        return [profile for profile in candidates if profile.range_rejection(offer) is None]
+
+
+_profiles: list[SearchProfile] | None = None
+
+
+def get_profiles() -> list[SearchProfile]:
+    """Get all search profiles.
+
+    The config is reloaded, if it changed on disk. The profiles, including their
+    filters, are only rebuilt in that case.
+    """
+    global _profiles
+    if reload_config() or _profiles is None:
+        profiles = []
+        for options in config["profiles"]:
+            try:
+                profiles.append(SearchProfile(options))
+            except KeyError as ex:
+                logger.error(f"Ignoring search profile without {ex}: {options}")
+
+        _profiles = profiles
+        logger.info(f"Loaded search profiles: {_profiles}")
+
+    return _profiles
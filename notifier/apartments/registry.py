@@ -0,0 +1,62 @@
+import re
+from collections.abc import Callable
+
+from .offer import Apartment
+from .profiles import SearchProfile
+
+Parser = Callable[[str, str, frozenset[str], int | None], list[Apartment]]
+UrlBuilder = Callable[[SearchProfile], str]
+PageUrlBuilder = Callable[[str, int], str]
+
+
+class Site:
+    """A site that can be scraped.
+
+    `parse_offers` extracts all new offers from a search page's text.
+    It runs in a worker process, which is why it must be a module level function.
+    `build_url` builds the search url for the criteria of a profile.
+    `page_url` turns a search url into the url of a specific result page.
+    `offer_id_pattern` matches the ids of all offers in a search page's text.
+    """
+
+    name: str
+    parse_offers: Parser
+    build_url: UrlBuilder
+    page_url: PageUrlBuilder
+    offer_id_pattern: re.Pattern
+
+    def __init__(
+        self,
+        name: str,
+        parse_offers: Parser,
+        build_url: UrlBuilder,
+        page_url: PageUrlBuilder,
+        offer_id_pattern: re.Pattern,
+    ):
+        self.name = name
+        self.parse_offers = parse_offers
+        self.build_url = build_url
+        self.page_url = page_url
+        self.offer_id_pattern = offer_id_pattern
+
+
+# All known sites by their name.
+sites: dict[str, Site] = {}
+
+
+def register_scraper(
+    name: str,
+    build_url: UrlBuilder,
+    page_url: PageUrlBuilder,
+    offer_id_pattern: re.Pattern,
+) -> Callable[[Parser], Parser]:
+    """Register the page parser of a site.
+
+    The site is scraped once per distinct search url during each scrape cycle.
+    """
+
+    def decorator(parse_offers: Parser) -> Parser:
+        sites[name] = Site(name, parse_offers, build_url, page_url, offer_id_pattern)
+        return parse_offers
+
+    return decorator
@@ -0,0 +1,243 @@
+"""Flag offers that're most likely scams.
+
+Scam offers are usually way too cheap for their location. Each district gets a
+baseline of the price per m² of its offers, which is updated with every batch of
+offers and seeded from the offer history on startup. Offers far below the usual
+prices of their district are flagged as outliers. The medians are tracked with
+streaming quantile sketches, so the history never needs to be kept in memory.
+
+Each check is a scorer, which returns the reason why it thinks an offer is a scam.
+Further scorers can be registered with `register_scorer` and enabled in the config.
+"""
+import math
+from collections.abc import Callable, Iterable
+from dataclasses import replace
+
+from notifier import metrics
+from notifier.config import config
+from notifier.logging import logger
+
+from .offer import Apartment
+
+Scorer = Callable[[Apartment, "Baselines"], str | None]
+
+
+class QuantileSketch:
+    """Approximate quantiles of a stream of positive values.
+
+    Values are counted in buckets of exponentially growing width, so each quantile
+    is within `accuracy` of the real value, relative to it (like DDSketch).
+    Adding a value takes constant time and the memory only grows with the range
+    of the values, not their amount.
+    """
+
+    def __init__(self, accuracy: float = 0.01) -> None:
+        self.gamma = (1 + accuracy) / (1 - accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.buckets: dict[int, int] = {}
+        self.count = 0
+
+    def add(self, value: float) -> None:
+        if value <= 0:
+            return
+
+        index = math.ceil(math.log(value) / self.log_gamma)
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+        self.count += 1
+
+    def quantiles(self, quantiles: list[float]) -> list[float]:
+        """Get multiple quantiles with a single pass over the buckets."""
+        if self.count == 0:
+            return [math.nan for _ in quantiles]
+
+        ranks = sorted((q * (self.count - 1), position) for position, q in enumerate(quantiles))
+        result = [math.nan for _ in quantiles]
+        seen = 0
+        current = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            # Each bucket is represented by the middle of its range.
+            value = 2 * self.gamma**index / (self.gamma + 1)
+            while current < len(ranks) and ranks[current][0] < seen:
+                result[ranks[current][1]] = value
+                current += 1
+
+        return result
+
+
+class Baseline:
+    """The usual price per m² of offers in a district.
+
+    The quantiles are cached and only recomputed on first use after new offers
+    have been added, so checking an offer takes constant time.
+    """
+
+    sketch: QuantileSketch
+    # The median or `None`, if it needs an update.
+    _median: float | None
+
+    def __init__(self, accuracy: float) -> None:
+        self.sketch = QuantileSketch(accuracy)
+        self._median = None
+
+    def add(self, price_per_sqm: float) -> None:
+        self.sketch.add(price_per_sqm)
+        self._median = None
+
+    def count(self) -> int:
+        return self.sketch.count
+
+    def median(self) -> float:
+        if self._median is None:
+            self._median = self.sketch.quantiles([0.5])[0]
+
+        return self._median
+
+
+class Baselines:
+    """The baselines of all districts and of all offers together.
+
+    Districts with only a few offers fall back to the baseline of all offers.
+    """
+
+    def __init__(self, accuracy: float = 0.01, min_samples: int = 30) -> None:
+        self.accuracy = accuracy
+        self.min_samples = min_samples
+        self.districts: dict[str, Baseline] = {}
+        self.overall = Baseline(accuracy)
+
+    def add(self, district: str, price_per_sqm: float) -> None:
+        if district not in self.districts:
+            self.districts[district] = Baseline(self.accuracy)
+        self.districts[district].add(price_per_sqm)
+        self.overall.add(price_per_sqm)
+
+    def get(self, district: str) -> Baseline | None:
+        """Get the baseline that's used for a district, if there're enough offers for any."""
+        baseline = self.districts.get(district)
+        if baseline is not None and baseline.count() >= self.min_samples:
+            return baseline
+        if self.overall.count() >= self.min_samples:
+            return self.overall
+
+        return None
+
+
+# All known scorers by their name.
+scorers: dict[str, Scorer] = {}
+
+
+def register_scorer(name: str) -> Callable[[Scorer], Scorer]:
+    """Register a scorer, which can then be enabled in `scam.scorers`."""
+
+    def decorator(scorer: Scorer) -> Scorer:
+        scorers[name] = scorer
+        return scorer
+
+    return decorator
+
+
+@register_scorer("private_provider")
+def private_provider(offer: Apartment, baselines: Baselines) -> str | None:
+    """Scam offers are usually posted by private providers on Immowelt."""
+    if offer.provider == "Privater Anbieter":
+        return "Privater Anbieter"
+
+    return None
+
+
+@register_scorer("too_cheap")
+def too_cheap(offer: Apartment, baselines: Baselines) -> str | None:
+    """Offers of private providers with a ridiculously low price per m²."""
+    price_per_sqm = offer.price_per_sqm
+    if price_per_sqm is None or offer.provider != "Privater Anbieter":
+        return None
+    if price_per_sqm <= config["scam"]["min_price_per_sqm"]:
+        return "Zu günstig"
+
+    return None
+
+
+@register_scorer("price_outlier")
+def price_outlier(offer: Apartment, baselines: Baselines) -> str | None:
+    """Offers that're a lot cheaper than usual in their district."""
+    price_per_sqm = offer.price_per_sqm
+    if price_per_sqm is None:
+        return None
+
+    baseline = baselines.get(offer.district)
+    if baseline is None:
+        return None
+
+    median = baseline.median()
+    if price_per_sqm < median * config["scam"]["outlier_ratio"]:
+        return f"Zu günstig für {offer.district} ({price_per_sqm:.1f} statt ~{median:.1f} €/m²)"
+
+    return None
+
+
+class ScamScorer:
+    """Runs all enabled scorers over each batch of new offers.
+
+    Offers that aren't flagged are added to the baselines afterwards, so a batch
+    of scams doesn't make itself look normal.
+    """
+
+    def __init__(self) -> None:
+        scam_config = config["scam"]
+        self.baselines = Baselines(scam_config["accuracy"], scam_config["min_samples"])
+        # The enabled scorers for the names in the config they've been looked up for.
+        self.names: list[str] = []
+        self.enabled: list[Scorer] = []
+
+        unknown = [name for name in scam_config["scorers"] if name not in scorers]
+        if len(unknown) > 0:
+            raise ValueError(
+                f"Unknown scam scorers {', '.join(unknown)}, use any of {', '.join(scorers)}"
+            )
+
+    def enabled_scorers(self) -> list[Scorer]:
+        """Look up the scorers that're enabled in the config.
+
+        The config may be reloaded at any time. Unknown names are skipped then,
+        so a typo doesn't stop the scrapers.
+        """
+        names = config["scam"]["scorers"]
+        if names != self.names:
+            for name in names:
+                if name not in scorers:
+                    logger.error(f"Ignoring unknown scam scorer {name}")
+            self.names = list(names)
+            self.enabled = [scorers[name] for name in names if name in scorers]
+
+        return self.enabled
+
+    def seed(self, prices: Iterable[tuple[str, float]]) -> int:
+        """Add the prices per m² of known offers by district to the baselines."""
+        count = 0
+        for district, price_per_sqm in prices:
+            self.baselines.add(district, price_per_sqm)
+            count += 1
+
+        return count
+
+    def score(self, offers: list[Apartment]) -> list[Apartment]:
+        """Get the offers with all scam reasons of the enabled scorers."""
+        scam_config = config["scam"]
+        if not scam_config["enabled"]:
+            return offers
+
+        enabled = self.enabled_scorers()
+        result = []
+        for offer in offers:
+            reasons = [reason for scorer in enabled if (reason := scorer(offer, self.baselines))]
+            if len(reasons) > 0:
+                metrics.scam_offers.inc(site=offer.source)
+                offer = replace(offer, scam=True, scam_reason=tuple(reasons))
+            result.append(offer)
+
+        for offer in result:
+            if not offer.scam and offer.price_per_sqm is not None:
+                self.baselines.add(offer.district, offer.price_per_sqm)
+
+        return result
@@ -0,0 +1,189 @@
+"""Adaptive polling intervals for each site.
+
+Each site is polled by its own job, which reschedules itself after each run.
+The interval adapts to what we observe:
+- New offers halve the interval, as more are likely to follow soon.
+- Polls without new offers slowly increase the interval, e.g. at night.
+- Errors double and rate limits quadruple the interval.
+
+All intervals are bound by a minimum and maximum and get some random jitter, so
+polls don't happen at suspiciously regular times. On top of that, a global request
+budget caps the total amount of requests over all sites.
+
+Sites that keep failing are stopped completely by a circuit breaker, until a single
+probe shows that they work again.
+"""
+import random
+import time
+
+from notifier.config import config
+
+
+class ScrapeResult:
+    """The outcome of a single poll of a site."""
+
+    new_offers: int
+    requests: int
+    failed: bool
+    rate_limited: bool
+    # A description of what went wrong, if the poll failed.
+    error: str | None
+
+    def __init__(
+        self,
+        new_offers: int = 0,
+        requests: int = 0,
+        failed: bool = False,
+        rate_limited: bool = False,
+        error: str | None = None,
+    ):
+        self.new_offers = new_offers
+        self.requests = requests
+        self.failed = failed
+        self.rate_limited = rate_limited
+        self.error = error
+
+
+class RequestBudget:
+    """A token bucket for the amount of requests over all sites."""
+
+    def __init__(self, requests_per_hour: float) -> None:
+        self.rate = requests_per_hour / 3600
+        self.capacity = requests_per_hour
+        self.tokens = requests_per_hour
+        self.updated_at = time.monotonic()
+
+    def refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def consume(self, requests: int) -> None:
+        """Take the tokens for requests that have been sent."""
+        self.refill()
+        self.tokens -= requests
+
+    def wait_time(self, requests: int) -> float:
+        """The time until there're enough tokens for the given amount of requests."""
+        self.refill()
+        missing = requests - self.tokens
+        if missing <= 0:
+            return 0
+
+        return missing / self.rate
+
+
+class CircuitBreaker:
+    """Stop polling a site that keeps failing.
+
+    - `closed`: The site is polled as usual.
+    - `open`: The site failed too often in a row. It isn't polled until the cooldown is over.
+    - `half_open`: The cooldown is over and a single probe is running. If it succeeds,
+      the breaker closes. Otherwise it opens again with twice the cooldown.
+    """
+
+    state: str
+    # Failed polls in a row
+    failures: int
+    cooldown: float
+    opened_at: float
+
+    def __init__(self) -> None:
+        self.state = "closed"
+        self.failures = 0
+        self.cooldown = config["circuit_breaker"]["cooldown"]
+        self.opened_at = 0.0
+
+    def remaining(self) -> float:
+        """The time until the site may be probed."""
+        if self.state != "open":
+            return 0
+
+        return max(0, self.opened_at + self.cooldown - time.monotonic())
+
+    def try_poll(self) -> bool:
+        """Check whether the site may be polled and start a probe, if it's time for one."""
+        if self.state == "open":
+            if self.remaining() > 0:
+                return False
+            self.state = "half_open"
+
+        return True
+
+    def record(self, result: ScrapeResult) -> str | None:
+        """Record the result of a poll.
+
+        Returns `opened` or `closed`, if the breaker changed in a way worth an alert.
+        Failed probes only extend the cooldown, so a broken site is reported once.
+        """
+        breaker_config = config["circuit_breaker"]
+        if not (result.failed or result.rate_limited):
+            self.failures = 0
+            self.cooldown = breaker_config["cooldown"]
+            if self.state == "half_open":
+                self.state = "closed"
+                return "closed"
+            return None
+
+        self.failures += 1
+        if self.state == "half_open":
+            self.cooldown = min(self.cooldown * 2, breaker_config["max_cooldown"])
+            self.state = "open"
+            self.opened_at = time.monotonic()
+        elif self.state == "closed" and self.failures >= breaker_config["failure_threshold"]:
+            self.state = "open"
+            self.opened_at = time.monotonic()
+            return "opened"
+
+        return None
+
+
+class Scheduler:
+    """Determine the polling interval of each site."""
+
+    def __init__(self) -> None:
+        self.intervals: dict[str, float] = {}
+        # The average amount of requests per poll of each site.
+        self.requests_per_poll: dict[str, float] = {}
+        self.budget = RequestBudget(config["scheduling"]["requests_per_hour"])
+        self.breakers: dict[str, CircuitBreaker] = {}
+
+    def breaker(self, site: str) -> CircuitBreaker:
+        """Get the circuit breaker of a site."""
+        if site not in self.breakers:
+            self.breakers[site] = CircuitBreaker()
+
+        return self.breakers[site]
+
+    def next_interval(self, site: str, result: ScrapeResult) -> float:
+        """Record the result of a poll and return the time until the next poll."""
+        scheduling = config["scheduling"]
+        interval = self.intervals.get(site, scheduling["initial_interval"])
+
+        if result.rate_limited:
+            interval *= 4
+        elif result.failed:
+            interval *= 2
+        elif result.new_offers > 0:
+            interval /= 2
+        else:
+            interval *= scheduling["backoff_factor"]
+
+        interval = max(scheduling["min_interval"], min(scheduling["max_interval"], interval))
+        self.intervals[site] = interval
+
+        # Spread the polls a little
+        jitter = scheduling["jitter"]
+        delay = interval * random.uniform(1 - jitter, 1 + jitter)
+
+        # Make sure we stay within the request budget
+        self.budget.consume(result.requests)
+        average = self.requests_per_poll.get(site, result.requests)
+        average = 0.8 * average + 0.2 * result.requests
+        self.requests_per_poll[site] = average
+        delay = max(delay, self.budget.wait_time(max(1, round(average))))
+
+        # Stopped sites are only polled again, once it's time to probe them.
+        delay = max(delay, self.breaker(site).remaining())
+
+        return delay
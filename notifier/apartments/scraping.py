@@ -0,0 +1,121 @@
+import asyncio
+from functools import partial
+
+from telegram.ext import CallbackContext
+
+from notifier import metrics
+from notifier.config import config
+from notifier.http_client import (
+    fetch,
+    is_unchanged,
+    page_fingerprint,
+    remember_page,
+    remembered_ids,
+)
+from notifier.logging import logger
+
+from .offer import Apartment
+from .parsing import run_parser
+from .searches import Search
+
+
+async def scrape_search(context: CallbackContext, search: Search) -> list[Apartment] | None:
+    """Fetch the pages of a search and return all offers that're new to any chat.
+
+    Usually only the first page is fetched. If even its last offer is new, there
+    might be more new offers on the following pages. In that case further pages are
+    fetched concurrently, until a page reaches known offers or `max_pages` is hit.
+
+    Returns `None`, if the first page didn't change since the last visit.
+    """
+    offers, has_more = await scrape_page(context, search, search.url)
+    if offers is None:
+        return None
+
+    page = 1
+    while has_more and page < search.max_pages:
+        last_page = min(page + config["scraping"]["page_concurrency"], search.max_pages)
+        pages = range(page + 1, last_page + 1)
+        logger.info(f"Fetching pages {pages.start}-{pages.stop - 1} of {search.site.name}")
+
+        results = await asyncio.gather(
+            *[scrape_page(context, search, search.site.page_url(search.url, n)) for n in pages],
+            return_exceptions=True,
+        )
+
+        # Offers may move to the next page while we fetch, so we might see them twice.
+        seen_ids = {offer.id for offer in offers}
+        has_more = True
+        for result in results:
+            # A broken further page must not lose the offers we already found.
+            # This also happens, if we run past the last page.
+            if isinstance(result, Exception):
+                logger.warning(f"Failed to fetch further page of {search.site.name}: {result}")
+                has_more = False
+                continue
+
+            page_offers, page_has_more = result
+            for offer in page_offers or []:
+                if offer.id not in seen_ids:
+                    seen_ids.add(offer.id)
+                    offers.append(offer)
+            has_more = has_more and page_has_more
+        page = last_page
+
+    return offers
+
+
+async def scrape_page(
+    context: CallbackContext,
+    search: Search,
+    url: str,
+) -> tuple[list[Apartment] | None, bool]:
+    """Fetch a single result page and return all offers that're new to any chat.
+
+    Also returns whether the following page might contain new offers as well,
+    which is the case if the last offer on this page is new.
+    The offers are `None`, if the page didn't change since the last visit.
+    """
+    site = search.site
+
+    # Load the side with the our current search criteria
+    search.requests += 1
+    with metrics.stage_duration.time(stage="fetch", site=site.name):
+        response = await fetch(url, conditional=True)
+    metrics.pages.inc(site=site.name, status="fetched")
+    if response.status_code == 304:
+        metrics.pages.inc(site=site.name, status="not_modified")
+        # The page still lists the same offers as on the last visit.
+        context.bot_data["history"].touch(site.name, remembered_ids(url))
+        return None, False
+    # Error pages don't contain any offers. Count them as failures instead.
+    response.raise_for_status()
+
+    # Skip pages, whose list of offers didn't change.
+    ids = site.offer_id_pattern.findall(response.text)
+    context.bot_data["history"].touch(site.name, ids)
+    fingerprint = page_fingerprint(ids or response.text)
+    if is_unchanged(url, fingerprint):
+        metrics.pages.inc(site=site.name, status="unchanged")
+        return None, False
+
+    # Only parse the page, if there's anything new on it.
+    known_ids = search.known_ids(context.bot_data["known_keys"], ids)
+    if len(ids) > 0 and known_ids.issuperset(ids):
+        offers = []
+    else:
+        with metrics.stage_duration.time(stage="parse", site=site.name):
+            offers = await run_parser(
+                site.parse_offers,
+                response.text,
+                known_ids,
+                config["scraping"]["known_run_limit"],
+            )
+
+    # The page is only remembered, once its offers have been sent.
+    if response.status_code == 200:
+        search.pending_pages.append(partial(remember_page, url, response, fingerprint, ids))
+
+    has_more = len(ids) > 0 and ids[-1] not in known_ids
+
+    return offers, has_more
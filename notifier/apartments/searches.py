@@ -0,0 +1,91 @@
+from collections.abc import Callable
+
+from notifier.known_keys import KnownKeys, known_keys_site
+from notifier.logging import logger
+
+from .profiles import ProfileIndex, SearchProfile, get_profiles
+from .registry import Site, sites
+
+
+class Search:
+    """A distinct search url on a site and all profiles that subscribed to it.
+
+    Each search is only fetched once per cycle, no matter how many profiles use it.
+    """
+
+    site: Site
+    url: str
+    profiles: list[SearchProfile]
+    index: ProfileIndex
+    max_pages: int
+    # The amount of requests that have been sent for this search.
+    requests: int
+    # All subscribed chats and the names under which their known keys are stored.
+    chat_ids: list[int | str]
+    known_keys_sites: list[str]
+    # Remembers the pages of the current visit, once their offers have been handled.
+    pending_pages: list[Callable[[], None]]
+
+    def __init__(self, site: Site, url: str, profiles: list[SearchProfile]):
+        self.site = site
+        self.url = url
+        self.profiles = profiles
+        self.index = ProfileIndex(profiles)
+        self.max_pages = max(profile.max_pages for profile in profiles)
+        self.requests = 0
+        self.pending_pages = []
+
+        self.chat_ids = list(dict.fromkeys(profile.chat_id for profile in profiles))
+        self.known_keys_sites = [known_keys_site(site.name, chat_id) for chat_id in self.chat_ids]
+
+    def known_ids(self, known_keys: KnownKeys, ids: list[str]) -> frozenset[str]:
+        """Get the ids that every subscribed chat already knows about.
+
+        All known ids are marked as seen, as they're still listed.
+        """
+        known = set()
+        for offer_id in ids:
+            if all(known_keys.has_key(site, offer_id) for site in self.known_keys_sites):
+                known.add(offer_id)
+                for site in self.known_keys_sites:
+                    known_keys.touch(site, offer_id)
+
+        return frozenset(known)
+
+    def remember_pages(self) -> None:
+        """Skip the fetched pages on the next visit, if they didn't change."""
+        for remember in self.pending_pages:
+            remember()
+        self.pending_pages = []
+
+    def __repr__(self) -> str:
+        return f"Search({self.site.name}, {len(self.profiles)} profiles, {self.url})"
+
+
+_searches: list[Search] = []
+_searches_profiles: list[SearchProfile] | None = None
+
+
+def get_searches() -> list[Search]:
+    """Group all search profiles by their search url.
+
+    The searches are only rebuilt, when the profiles have been reloaded.
+    """
+    global _searches, _searches_profiles
+    profiles = get_profiles()
+    if profiles is _searches_profiles:
+        return _searches
+
+    grouped: dict[tuple[str, str], list[SearchProfile]] = {}
+    for profile in profiles:
+        if profile.site not in sites:
+            logger.error(f"There's no scraper for site {profile.site}")
+            continue
+
+        url = sites[profile.site].build_url(profile)
+        grouped.setdefault((profile.site, url), []).append(profile)
+
+    _searches = [Search(sites[site], url, group) for (site, url), group in grouped.items()]
+    _searches_profiles = profiles
+
+    return _searches
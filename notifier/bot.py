@@ -0,0 +1,147 @@
+import asyncio
+import time
+
+from telegram.error import BadRequest, NetworkError, TimedOut
+from telegram.ext import Application, ContextTypes
+
+from notifier import metrics
+from notifier.apartments.duplicates import DuplicateIndex
+from notifier.apartments.jobs import schedule_scrapers
+from notifier.apartments.parsing import shutdown_executor
+from notifier.apartments.scam import ScamScorer
+from notifier.apartments.scheduler import Scheduler
+from notifier.config import config
+from notifier.history import OfferHistory
+from notifier.http_client import close_client
+from notifier.known_keys import KnownKeys
+from notifier.logging import logger
+from notifier.send_queue import SendQueue
+
+
+def init_telegram(bot_api_url: str | None = None):
+    """Initialize the telegram application and schedule all jobs.
+
+    `bot_api_url` points the bot to another Bot API server than telegram's.
+    """
+    builder = (
+        Application.builder()
+        .token(config["telegram"]["api_key"])
+        .concurrent_updates(5)
+        .post_init(post_init)
+        .post_stop(post_stop)
+        .post_shutdown(post_shutdown)
+    )
+    if bot_api_url is not None:
+        builder = builder.base_url(f"{bot_api_url}/bot").base_file_url(f"{bot_api_url}/file/bot")
+    app = builder.build()
+
+    app.add_error_handler(error_handler)
+
+    job_queue = app.job_queue
+    schedule_scrapers(job_queue)
+    job_queue.run_repeating(
+        compact_known_keys,
+        interval=config["known_keys"]["compaction_interval"],
+        name="Compact known keys",
+    )
+    job_queue.run_repeating(
+        write_history,
+        interval=config["history"]["write_interval"],
+        name="Write offer history",
+    )
+    if config["metrics"]["file"] != "":
+        job_queue.run_repeating(
+            write_metrics,
+            interval=config["metrics"]["file_interval"],
+            name="Write metrics",
+        )
+
+    return app
+
+
+async def post_init(app: Application) -> None:
+    """Load all state that's shared between the scrapers."""
+    known_keys = KnownKeys()
+    known_keys.read_from_disk()
+    known_keys.compact(config["known_keys"]["retention_days"])
+    app.bot_data["known_keys"] = known_keys
+    app.bot_data["send_queue"] = SendQueue(app.bot)
+    app.bot_data["scheduler"] = Scheduler()
+    app.bot_data["scrape_semaphore"] = asyncio.Semaphore(config["scraping"]["max_concurrency"])
+    history = OfferHistory()
+    app.bot_data["history"] = history
+    app.bot_data["scam_scorer"] = await load_scam_scorer(history)
+    duplicates = config["duplicates"]
+    app.bot_data["duplicates"] = DuplicateIndex(
+        duplicates["window"] * 60 * 60,
+        duplicates["price_tolerance"],
+        duplicates["size_tolerance"],
+        duplicates["min_similarity"],
+    )
+
+    metrics.known_keys_size.set_function(known_keys.size)
+    metrics.send_queue_depth.set_function(app.bot_data["send_queue"].size)
+    if config["metrics"]["port"] != 0:
+        app.bot_data["metrics_server"] = await metrics.start_metrics_server(
+            config["metrics"]["host"],
+            config["metrics"]["port"],
+        )
+
+
+async def load_scam_scorer(history: OfferHistory) -> ScamScorer:
+    """Create the scam scorer with the usual prices of recent offers from the history."""
+    scam_scorer = ScamScorer()
+    if config["history"]["enabled"] and config["scam"]["enabled"]:
+        since = time.time() - config["scam"]["baseline_days"] * 24 * 60 * 60
+        count = await asyncio.to_thread(scam_scorer.seed, history.prices_per_sqm(since))
+        logger.info(f"Loaded the prices of {count} offers for scam detection")
+
+    return scam_scorer
+
+
+async def post_stop(app: Application) -> None:
+    """Send the pending messages, while the bot is still usable.
+
+    The bot's connections are closed during shutdown, which happens after this.
+    """
+    await app.bot_data["send_queue"].stop()
+
+
+async def post_shutdown(app: Application) -> None:
+    """Release all resources that're shared between the scrapers."""
+    if "metrics_server" in app.bot_data:
+        app.bot_data["metrics_server"].close()
+    await close_client()
+    shutdown_executor()
+    app.bot_data["known_keys"].close()
+    app.bot_data["history"].close()
+
+
+async def compact_known_keys(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Forget keys of offers that haven't been seen for a long time."""
+    context.bot_data["known_keys"].compact(config["known_keys"]["retention_days"])
+
+
+async def write_history(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Write all recently scraped offers to the history, without blocking the scrapers."""
+    await asyncio.to_thread(context.bot_data["history"].write_to_disk)
+
+
+async def write_metrics(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Write the current metrics to the configured file."""
+    metrics.write_metrics_file(config["metrics"]["file"])
+
+
+async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Ignore any errors."""
+
+    # Ignore telegram network errors
+    ex = context.error
+    if ex is None:
+        return
+
+    if type(ex) is TimedOut or type(ex) is NetworkError or type(ex) is BadRequest:
+        return
+
+    # Raise all other exceptions
+    raise ex
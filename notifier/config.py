@@ -1,9 +1,8 @@
 """Config values for pollbot."""
 import os
-import sys
 import tomllib
 
-import tomli_w
+from notifier.logging import logger
 
 default_config = {
     "telegram": {
@@ -14,21 +13,235 @@ default_config = {
     "logging": {
         "debug": False,
     },
+    "scraping": {
+        # The maximum amount of searches that're scraped at once over all sites.
+        "max_concurrency": 4,
+        "timeout": 120,
+        # The html parser. One of `auto`, `lxml` or `html.parser`.
+        # `auto` uses lxml if it's installed.
+        "parser": "auto",
+        # Whether pages are parsed in a `process` or `thread` pool.
+        "parser_pool": "process",
+        "parser_workers": 2,
+        # Stop extracting offers from a page after this many known offers in a row.
+        "known_run_limit": 5,
+        # Further result pages are only fetched, while pages are full of new offers.
+        # These are the maximum amount of pages per search and how many are fetched at once.
+        "max_pages": 3,
+        "page_concurrency": 2,
+    },
+    "scheduling": {
+        # Bounds for the polling interval of each site in seconds.
+        "initial_interval": 5 * 60,
+        "min_interval": 2 * 60,
+        "max_interval": 20 * 60,
+        # The interval grows by this factor after each poll without new offers.
+        "backoff_factor": 1.2,
+        # Random variation of each interval, as a fraction of the interval.
+        "jitter": 0.1,
+        # The maximum amount of requests over all sites.
+        "requests_per_hour": 120,
+    },
+    "circuit_breaker": {
+        # Stop polling a site after this many failed polls in a row.
+        "failure_threshold": 3,
+        # Seconds until a stopped site is probed again.
+        # This doubles with each failed probe, up to `max_cooldown`.
+        "cooldown": 10 * 60,
+        "max_cooldown": 6 * 60 * 60,
+    },
+    "send_queue": {
+        # Messages per second over all chats.
+        "global_rate": 25,
+        # Messages per second and burst size for a single chat.
+        "chat_rate": 0.3,
+        "chat_burst": 3,
+        "max_retries": 5,
+        # Seconds to wait for pending messages on shutdown.
+        "shutdown_timeout": 30,
+    },
+    "digest": {
+        # Combine offers into a single message, instead of sending a message per offer.
+        "enabled": False,
+        # Wait this many seconds for further offers after the first one.
+        # With 0, only offers that're already waiting are combined, e.g. during bursts.
+        "window": 0,
+        # Only combine offers, if there're at least this many.
+        "threshold": 2,
+        # Telegram's limit for the length of a single message.
+        "max_length": 4096,
+        # Overrides of these options for single chats by chat id.
+        # E.g. `"-100123" = { enabled = true, window = 60 }`
+        "chats": {},
+    },
+    "duplicates": {
+        # Don't notify chats about offers they already got from another site.
+        "enabled": True,
+        # `suppress` drops duplicates, `mention` sends a short note with the link instead.
+        "mode": "suppress",
+        # How long offers are remembered in hours.
+        "window": 72,
+        # Maximum relative difference of price and size between duplicates.
+        "price_tolerance": 0.02,
+        "size_tolerance": 0.02,
+        # Minimum similarity of title, location, price and size between 0 and 1.
+        "min_similarity": 0.3,
+    },
+    "scam": {
+        # Flag offers that're most likely scams. They're still sent, but marked as such.
+        "enabled": True,
+        # The checks that are run for each offer, see `notifier/apartments/scam.py`.
+        "scorers": ["private_provider", "too_cheap", "price_outlier"],
+        # Offers of private providers with a lower price per m² are too cheap.
+        "min_price_per_sqm": 10,
+        # Offers whose price per m² is below this fraction of the median in their
+        # district are too cheap.
+        "outlier_ratio": 0.5,
+        # Districts with fewer offers use the prices of all districts instead.
+        "min_samples": 30,
+        # The relative error of the price quantiles.
+        "accuracy": 0.01,
+        # How many days of the offer history are used for the prices on startup.
+        "baseline_days": 90,
+    },
+    "known_keys": {
+        # Keys that haven't been seen for this many days are forgotten.
+        # Must be well above the two days after which offers are ignored anyway.
+        "retention_days": 30,
+        "compaction_interval": 6 * 60 * 60,
+    },
+    "history": {
+        # Keep all scraped offers in a database for later analysis, see `main.py history`.
+        "enabled": True,
+        # Seconds between writes of the buffered offers.
+        "write_interval": 60,
+    },
+    "metrics": {
+        # Serve metrics on this port on `host`. 0 disables the endpoint.
+        "host": "127.0.0.1",
+        "port": 0,
+        # Regularly write the metrics to this file. An empty path disables this.
+        "file": "",
+        "file_interval": 60,
+    },
+    "http": {
+        # Timeout for each step of a request, e.g. connecting or reading a chunk.
+        "timeout": 30,
+        # Deadline for a whole request, which slowly trickling responses might exceed.
+        "request_timeout": 60,
+        "connect_timeout": 10,
+        "max_connections": 10,
+        "max_connections_per_host": 2,
+        "keepalive_expiry": 600,
+    },
+    # Each search profile describes a single search on a site.
+    # Optional fields:
+    # - `chat_id`, the chat that's notified. Defaults to `telegram.target_channel`.
+    # - `url`, an explicit search url, which is used instead of the generated one.
+    # - `forbidden_words` and `forbidden_areas`, which default to the built-in lists.
+    # - `max_price`, `max_price_per_sqm`, `min_size`, `max_size`, `min_rooms` and
+    #   `max_rooms`, which are checked for each offer that lists these values.
+    "profiles": [
+        {
+            "name": "Hamburg",
+            "site": "Immowelt",
+            "city": "hamburg",
+            "max_price": 1500,
+            "min_size": 65,
+            "min_rooms": 3,
+        },
+        {
+            "name": "Hamburg",
+            "site": "Kleinanzeigen",
+            "city": "hamburg",
+            "location_id": "l9409",
+            "max_price": 1600,
+            "min_size": 65,
+            "min_rooms": 3,
+            "max_rooms": 5,
+        },
+    ],
 }
 
-config_path = os.path.expanduser("~/.config/telegram_notifier.toml")
+# The path can be overwritten, e.g. to run benchmarks with a throwaway config.
+config_path = os.path.expanduser(
+    os.environ.get("NOTIFIER_CONFIG", "~/.config/telegram_notifier.toml")
+)
+# The modification time of the config file, when it has been loaded.
+config_mtime: float | None = None
+
 
-if not os.path.exists(config_path):
-    with open(config_path, "wb") as file_descriptor:
-        tomli_w.dump(default_config, file_descriptor)
-    print("Please adjust the configuration file at '~/.config/kleinanzeigen.toml'")
-    sys.exit(1)
-else:
+def read_config() -> dict:
+    """Read the config file and fill in default values for all missing keys."""
     with open(config_path, "rb") as file_descriptor:
-        config = tomllib.load(file_descriptor)
+        loaded = tomllib.load(file_descriptor)
 
     # Set default values for any missing keys in the loaded config
     for key, category in default_config.items():
+        if isinstance(category, list):
+            loaded.setdefault(key, category)
+            continue
+
+        loaded.setdefault(key, {})
         for option, value in category.items():
-            if option not in config[key]:
-                config[key][option] = value
+            if option not in loaded[key]:
+                loaded[key][option] = value
+
+    return loaded
+
+
+def reload_config() -> bool:
+    """Reload the config, if the file changed since it has been loaded.
+
+    The config is updated in place, so all modules that imported it see the changes.
+    Returns whether the config has been reloaded.
+    """
+    global config_mtime
+    try:
+        mtime = os.stat(config_path).st_mtime
+    except OSError:
+        return False
+
+    if mtime == config_mtime:
+        return False
+
+    try:
+        new_config = read_config()
+    except Exception as ex:
+        # Keep the current config, if somebody saved a broken file.
+        logger.error(f"Failed to reload config: {ex}")
+        return False
+
+    config.clear()
+    config.update(new_config)
+    config_mtime = mtime
+
+    return True
+
+
+class MissingConfigError(Exception):
+    """There's no config file yet. A default one has been written instead."""
+
+
+def load_config() -> None:
+    """Load the config file into `config`.
+
+    This needs to happen once on startup, before anything else uses the config.
+    If there's no config file yet, a default one is written and `MissingConfigError`
+    is raised, as at least the telegram settings need to be adjusted.
+    """
+    global config_mtime
+    if not os.path.exists(config_path):
+        import tomli_w
+
+        with open(config_path, "wb") as file_descriptor:
+            tomli_w.dump(default_config, file_descriptor)
+        raise MissingConfigError(f"Please adjust the configuration file at '{config_path}'")
+
+    config_mtime = os.stat(config_path).st_mtime
+    config.clear()
+    config.update(read_config())
+
+
+# The current config. It's empty until `load_config` has been called.
+config: dict = {}
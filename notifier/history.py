@@ -0,0 +1,220 @@
+import os
+import sqlite3
+import threading
+import time
+import urllib.parse
+from collections.abc import Iterable, Iterator
+
+from notifier.apartments.offer import Apartment
+from notifier.config import config
+
+history_path = os.path.expanduser("~/.local/share/notifier_history.sqlite")
+
+# The columns offers can be grouped by in `OfferHistory.aggregate`.
+groupings = {
+    "source": "source",
+    "district": "district",
+    "day": "date(first_seen, 'unixepoch')",
+    "week": "strftime('%Y-%W', first_seen, 'unixepoch')",
+    "month": "strftime('%Y-%m', first_seen, 'unixepoch')",
+}
+
+
+class OfferHistory:
+    """Keeps all scraped offers for later analysis.
+
+    Each offer is stored once with the time it has been seen first and last.
+    An offer counts as seen, as long as its id shows up on a fetched result page,
+    so `last_seen` roughly tells when it disappeared. Only the first pages of each
+    search are fetched, which is why this is an upper bound.
+
+    Offers are buffered in memory and written in a single transaction on
+    `write_to_disk`, which is meant to be run in a worker thread.
+    Nothing is written, if the history is disabled.
+    A `read_only` history only opens an existing database, e.g. to aggregate it.
+    """
+
+    def __init__(self, read_only: bool = False) -> None:
+        self.read_only = read_only
+        # New offers and the last time already stored offers have been seen by key.
+        self.pending_offers: dict[tuple[str, str], tuple[Apartment, float]] = {}
+        self.pending_seen: dict[tuple[str, str], float] = {}
+        self.connection: sqlite3.Connection | None = None
+        # Guards the buffers, while the database may be written by a worker thread.
+        self.lock = threading.Lock()
+        self.write_lock = threading.Lock()
+
+    def add(self, offers: list[Apartment]) -> None:
+        """Remember newly scraped offers."""
+        if not config["history"]["enabled"]:
+            return
+
+        now = time.time()
+        with self.lock:
+            for offer in offers:
+                self.pending_offers[(offer.source, offer.id)] = (offer, now)
+
+    def touch(self, source: str, ids: Iterable[str]) -> None:
+        """Remember that offers are still listed."""
+        if not config["history"]["enabled"]:
+            return
+
+        now = time.time()
+        with self.lock:
+            for offer_id in ids:
+                self.pending_seen[(source, offer_id)] = now
+
+    def connect(self) -> sqlite3.Connection:
+        """Open the database and make sure the schema exists."""
+        if self.connection is None and self.read_only:
+            uri = f"file:{urllib.parse.quote(history_path)}?mode=ro"
+            self.connection = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        elif self.connection is None:
+            os.makedirs(os.path.dirname(history_path), exist_ok=True)
+            self.connection = sqlite3.connect(history_path, check_same_thread=False)
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute(
+                """CREATE TABLE IF NOT EXISTS offers (
+                    source TEXT NOT NULL,
+                    id TEXT NOT NULL,
+                    title TEXT NOT NULL,
+                    location TEXT NOT NULL,
+                    district TEXT NOT NULL,
+                    link TEXT NOT NULL,
+                    price REAL NOT NULL,
+                    size REAL,
+                    rooms REAL,
+                    price_per_sqm REAL,
+                    posted_at REAL,
+                    first_seen REAL NOT NULL,
+                    last_seen REAL NOT NULL,
+                    scam INTEGER NOT NULL,
+                    scam_reason TEXT NOT NULL,
+                    UNIQUE (source, id)
+                )"""
+            )
+            # Aggregates are usually limited to a time range and grouped by source or district.
+            # The indexes contain all aggregated columns, so queries never read the table.
+            aggregated = "price, price_per_sqm, scam, last_seen"
+            for name, columns in [
+                ("offers_first_seen", "first_seen, source, district"),
+                ("offers_source", "source, first_seen"),
+                ("offers_district", "district, first_seen"),
+            ]:
+                self.connection.execute(
+                    f"CREATE INDEX IF NOT EXISTS {name} ON offers ({columns}, {aggregated})"
+                )
+            self.connection.commit()
+
+        return self.connection
+
+    def write_to_disk(self) -> None:
+        """Write all buffered offers to the database."""
+        with self.lock:
+            offers, self.pending_offers = self.pending_offers, {}
+            seen, self.pending_seen = self.pending_seen, {}
+
+        if len(offers) == 0 and len(seen) == 0:
+            return
+
+        rows = [
+            (
+                offer.source,
+                offer.id,
+                offer.title,
+                offer.location,
+                offer.district,
+                offer.link,
+                offer.price,
+                offer.size,
+                offer.rooms,
+                offer.price_per_sqm,
+                offer.time.timestamp() if offer.time is not None else None,
+                now,
+                now,
+                offer.scam,
+                ", ".join(offer.scam_reason),
+            )
+            for offer, now in offers.values()
+        ]
+        with self.write_lock:
+            connection = self.connect()
+            with connection:
+                # Offers may be scraped again, e.g. for another chat, which only counts as seen.
+                connection.executemany(
+                    """INSERT INTO offers VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (source, id) DO UPDATE SET last_seen = excluded.last_seen""",
+                    rows,
+                )
+                connection.executemany(
+                    "UPDATE offers SET last_seen = ? WHERE source = ? AND id = ? AND last_seen < ?",
+                    [(now, source, offer_id, now) for (source, offer_id), now in seen.items()],
+                )
+
+    def prices_per_sqm(self, since: float) -> Iterator[tuple[str, float]]:
+        """Get the district and price per m² of all offers since then, that aren't scams."""
+        with self.write_lock:
+            rows = self.connect().execute(
+                """SELECT district, price_per_sqm FROM offers
+                WHERE first_seen >= ? AND price_per_sqm IS NOT NULL AND NOT scam""",
+                (since,),
+            )
+            yield from rows
+
+    def aggregate(
+        self,
+        group_by: str = "district",
+        since: float | None = None,
+        source: str | None = None,
+        district: str | None = None,
+    ) -> list[dict]:
+        """Get the amount, prices, scam rate and listing duration of offers by group.
+
+        Only offers that have been seen first after `since` are included.
+        """
+        conditions = []
+        parameters: list[object] = []
+        if since is not None:
+            conditions.append("first_seen >= ?")
+            parameters.append(since)
+        if source is not None:
+            conditions.append("source = ?")
+            parameters.append(source)
+        if district is not None:
+            conditions.append("district = ?")
+            parameters.append(district)
+        where = f"WHERE {' AND '.join(conditions)}" if len(conditions) > 0 else ""
+
+        query = f"""SELECT
+                {groupings[group_by]} AS name,
+                COUNT(*),
+                AVG(price),
+                AVG(price_per_sqm),
+                AVG(scam),
+                AVG(last_seen - first_seen)
+            FROM offers {where}
+            GROUP BY name
+            ORDER BY COUNT(*) DESC"""
+
+        with self.write_lock:
+            rows = self.connect().execute(query, parameters).fetchall()
+
+        return [
+            {
+                "name": name,
+                "offers": count,
+                "price": price,
+                "price_per_sqm": price_per_sqm,
+                "scam_rate": scam_rate,
+                "listed_hours": listed / 60 / 60,
+            }
+            for name, count, price, price_per_sqm, scam_rate, listed in rows
+        ]
+
+    def close(self) -> None:
+        """Write all remaining offers and close the database."""
+        self.write_to_disk()
+        with self.write_lock:
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
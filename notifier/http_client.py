@@ -0,0 +1,206 @@
+"""A shared async http client for all scrapers.
+
+All scrapers go through a single pooled client, which keeps connections to the portals
+alive between polls. This way repeated polls reuse the same TCP/TLS connections and no
+request ever blocks the event loop of the bot.
+
+The client also remembers the state of each fetched page. Pages are requested
+conditionally and scrapers can check whether the relevant part of a page changed,
+so unchanged pages don't need to be parsed at all.
+"""
+import asyncio
+import hashlib
+from urllib.parse import urlsplit
+
+import httpx
+
+from notifier.config import config
+
+try:
+    import h2  # noqa: F401
+
+    http2_available = True
+except ImportError:
+    http2_available = False
+
+try:
+    import charset_normalizer
+except ImportError:
+    charset_normalizer = None
+
+# Headers that're sent with every request.
+# Connection specific headers (`Host`, `Connection`) are handled by the client itself
+# and must not be set manually, as they're forbidden in HTTP/2.
+default_headers = {
+    "Accept": (
+        "text/html;charset=utf-8,"
+        + "application/xhtml+xml;charset=utf-8,"
+        + "application/xml;q=0.9;charset=utf-8,"
+        + "image/avif,image/webp,*/*;q=0.8"
+    ),
+    "Accept-Language": "en-US,en;q=0.5",
+    "Upgrade-Insecure-Requests": "1",
+    "User-Agent": "Mozilla/5.0 (X11; Linux x86_64; rv:109.0) Gecko/20100101 Firefox/117.0",
+}
+
+_client: httpx.AsyncClient | None = None
+_transport: httpx.AsyncBaseTransport | None = None
+_host_semaphores: dict[str, asyncio.Semaphore] = {}
+
+
+class RateLimitedError(Exception):
+    """The site told us to slow down."""
+
+
+class PageState:
+    """What we know about the last successfully processed version of a page."""
+
+    etag: str | None
+    last_modified: str | None
+    fingerprint: str | None
+    # The ids of all offers on the page, which are still listed, while it's unmodified.
+    ids: tuple[str, ...]
+
+    def __init__(
+        self,
+        etag: str | None,
+        last_modified: str | None,
+        fingerprint: str | None,
+        ids: tuple[str, ...] = (),
+    ):
+        self.etag = etag
+        self.last_modified = last_modified
+        self.fingerprint = fingerprint
+        self.ids = ids
+
+
+pages: dict[str, PageState] = {}
+
+
+def guess_encoding(content: bytes) -> str:
+    """Guess the encoding of responses that don't send any encoding information."""
+    if charset_normalizer is None:
+        return "utf-8"
+
+    return charset_normalizer.detect(content).get("encoding") or "utf-8"
+
+
+def use_transport(transport: httpx.AsyncBaseTransport | None) -> None:
+    """Send all requests through a custom transport, e.g. to local stand-ins of the portals.
+
+    This has to be done before the client is created.
+    """
+    global _transport
+    _transport = transport
+
+
+def get_client() -> httpx.AsyncClient:
+    """Get the shared client. The client is created on first use."""
+    global _client
+    if _client is None or _client.is_closed:
+        http_config = config["http"]
+        _client = httpx.AsyncClient(
+            headers=default_headers,
+            http2=http2_available,
+            timeout=httpx.Timeout(
+                http_config["timeout"],
+                connect=http_config["connect_timeout"],
+            ),
+            limits=httpx.Limits(
+                max_connections=http_config["max_connections"],
+                max_keepalive_connections=http_config["max_connections"],
+                keepalive_expiry=http_config["keepalive_expiry"],
+            ),
+            follow_redirects=True,
+            default_encoding=guess_encoding,
+            transport=_transport,
+        )
+
+    return _client
+
+
+def _host_semaphore(url: str) -> asyncio.Semaphore:
+    """Get the semaphore that limits the concurrent connections to a single host."""
+    host = urlsplit(url).netloc
+    if host not in _host_semaphores:
+        _host_semaphores[host] = asyncio.Semaphore(config["http"]["max_connections_per_host"])
+
+    return _host_semaphores[host]
+
+
+async def fetch(
+    url: str,
+    headers: dict[str, str] | None = None,
+    conditional: bool = False,
+) -> httpx.Response:
+    """Fetch a page via the shared client.
+
+    Conditional requests send the validators of the last processed version of the page.
+    The response has status `304` if the page didn't change since then.
+
+    Raises a `RateLimitedError`, if the site answers with `429`, and a `TimeoutError`,
+    if the request takes longer than `http.request_timeout`.
+    """
+    headers = dict(headers or {})
+    state = pages.get(url)
+    if conditional and state is not None:
+        if state.etag is not None:
+            headers["If-None-Match"] = state.etag
+        if state.last_modified is not None:
+            headers["If-Modified-Since"] = state.last_modified
+
+    async with _host_semaphore(url):
+        async with asyncio.timeout(config["http"]["request_timeout"]):
+            response = await get_client().get(url, headers=headers)
+
+    if response.status_code == 429:
+        raise RateLimitedError(f"Got rate limited by {url}")
+
+    return response
+
+
+def page_fingerprint(fragment: str | list[str]) -> str:
+    """Hash the relevant part of a page, e.g. the ids of all listed offers."""
+    if isinstance(fragment, list):
+        fragment = "\n".join(fragment)
+
+    return hashlib.sha1(fragment.encode()).hexdigest()
+
+
+def is_unchanged(url: str, fingerprint: str) -> bool:
+    """Check whether the relevant part of a page is the same as on the last visit."""
+    state = pages.get(url)
+    return state is not None and state.fingerprint == fingerprint
+
+
+def remembered_ids(url: str) -> tuple[str, ...]:
+    """Get the ids of the offers on the last successfully processed version of a page."""
+    state = pages.get(url)
+    return state.ids if state is not None else ()
+
+
+def remember_page(
+    url: str,
+    response: httpx.Response,
+    fingerprint: str,
+    ids: list[str],
+) -> None:
+    """Remember a page after it has been processed successfully.
+
+    This is only done afterwards, as a page that failed to be processed must not be
+    skipped on the next visit.
+    """
+    pages[url] = PageState(
+        response.headers.get("ETag"),
+        response.headers.get("Last-Modified"),
+        fingerprint,
+        tuple(ids),
+    )
+
+
+async def close_client() -> None:
+    """Close the shared client and all of its pooled connections."""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
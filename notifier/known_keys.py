@@ -1,9 +1,28 @@
 import os
+import sqlite3
+import threading
+import time
 import tomllib
 
-import tomli_w
+from notifier.config import config
+from notifier.logging import logger
 
-known_ids_path = os.path.expanduser("~/.local/share/notifier_known_ids.toml")
+known_ids_path = os.path.expanduser("~/.local/share/notifier_known_ids.sqlite")
+# The known ids used to be stored in a toml file.
+legacy_known_ids_path = os.path.expanduser("~/.local/share/notifier_known_ids.toml")
+
+
+def known_keys_site(source: str, chat_id: int | str) -> str:
+    """The name under which the known keys of a source are stored for a chat.
+
+    Keys are tracked per chat, so every chat gets notified about each offer once.
+    The default chat uses the plain source name, which keeps all keys from before
+    multiple chats were supported.
+    """
+    if str(chat_id) == str(config["telegram"]["target_channel"]):
+        return source
+
+    return f"{source}:{chat_id}"
 
 
 class KnownKeys:
@@ -11,36 +30,159 @@ class KnownKeys:
 
     This class holds all keys for things that the bot already notified about.
     It handles the keys of each site individually.
+
+    All keys are kept in memory for fast lookups. New keys are buffered and
+    appended to an sqlite database on `write_to_disk`, so each write only touches
+    the new keys. Every write is a single transaction, which is why a crash never
+    leaves a partially written store behind.
+
+    Each key remembers when it has been seen first and last. Keys that haven't been
+    seen for longer than the retention window are dropped by `compact`.
+
+    A single instance lives for the whole runtime of the bot and is shared between
+    all scrapers. All access is guarded by a lock, so it's safe to use from
+    concurrently running scrapers and worker threads.
     """
 
     def __init__(self) -> None:
-        self.known_keys: dict[str, list[str]] = {}
+        # The timestamp of the last time a key has been seen by site and key.
+        self.known_keys: dict[str, dict[str, float]] = {}
+        # Keys that have been added or seen since the last write, with their timestamp.
+        self.pending: dict[tuple[str, str], float] = {}
+        self.connection: sqlite3.Connection | None = None
+        self.lock = threading.RLock()
 
     def has_key(self, site: str, key: str) -> bool:
         """Check if a key has been notified about for a particular site."""
-        if site not in self.known_keys:
-            return False
+        with self.lock:
+            if site not in self.known_keys:
+                return False
 
-        return key in self.known_keys[site]
+            return key in self.known_keys[site]
 
     def add_key(self, site: str, key: str):
         """Save a notified key to a site."""
-        if site not in self.known_keys:
-            self.known_keys[site] = []
+        with self.lock:
+            if site not in self.known_keys:
+                self.known_keys[site] = {}
+
+            if key not in self.known_keys[site]:
+                self.touch(site, key)
+
+    def size(self) -> int:
+        """The amount of known keys over all sites."""
+        with self.lock:
+            return sum(len(keys) for keys in self.known_keys.values())
+
+    def touch(self, site: str, key: str):
+        """Remember that a key has just been seen again.
+
+        Keys of offers that're still listed must not expire, as we would otherwise
+        notify about them again.
+        """
+        with self.lock:
+            if site not in self.known_keys:
+                self.known_keys[site] = {}
+
+            now = time.time()
+            self.known_keys[site][key] = now
+            self.pending[(site, key)] = now
+
+    def connect(self) -> sqlite3.Connection:
+        """Open the database and make sure the schema exists."""
+        if self.connection is None:
+            os.makedirs(os.path.dirname(known_ids_path), exist_ok=True)
+            self.connection = sqlite3.connect(known_ids_path, check_same_thread=False)
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute(
+                """CREATE TABLE IF NOT EXISTS known_keys (
+                    site TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    first_seen REAL NOT NULL,
+                    last_seen REAL NOT NULL,
+                    PRIMARY KEY (site, key)
+                ) WITHOUT ROWID"""
+            )
+            self.connection.commit()
 
-        if not self.has_key(site, key):
-            self.known_keys[site].append(key)
+        return self.connection
 
     def read_from_disk(self):
-        """Read the known list from disk."""
-        # Don't read if there's no file yet.
-        if not os.path.exists(known_ids_path):
-            return
+        """Read the known keys from disk."""
+        with self.lock:
+            connection = self.connect()
+            self.migrate_legacy_file(connection)
 
-        with open(known_ids_path, "rb") as file_descriptor:
-            self.known_keys = tomllib.load(file_descriptor)
+            self.known_keys = {}
+            query = "SELECT site, key, last_seen FROM known_keys"
+            for site, key, last_seen in connection.execute(query):
+                if site not in self.known_keys:
+                    self.known_keys[site] = {}
+                self.known_keys[site][key] = last_seen
 
     def write_to_disk(self):
-        """Write the current updated list to disk."""
-        with open(known_ids_path, "wb") as file_descriptor:
-            tomli_w.dump(self.known_keys, file_descriptor)
+        """Write all new and recently seen keys to the database."""
+        with self.lock:
+            if len(self.pending) == 0:
+                return
+
+            connection = self.connect()
+            with connection:
+                connection.executemany(
+                    """INSERT INTO known_keys (site, key, first_seen, last_seen)
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT (site, key) DO UPDATE SET last_seen = excluded.last_seen""",
+                    [(site, key, seen, seen) for (site, key), seen in self.pending.items()],
+                )
+            self.pending = {}
+
+    def compact(self, retention_days: float):
+        """Drop all keys that haven't been seen within the retention window."""
+        threshold = time.time() - retention_days * 24 * 60 * 60
+
+        with self.lock:
+            self.write_to_disk()
+
+            removed = 0
+            for site, keys in self.known_keys.items():
+                remaining = {key: seen for key, seen in keys.items() if seen >= threshold}
+                removed += len(keys) - len(remaining)
+                self.known_keys[site] = remaining
+
+            connection = self.connect()
+            with connection:
+                connection.execute("DELETE FROM known_keys WHERE last_seen < ?", (threshold,))
+
+        if removed > 0:
+            logger.info(f"Removed {removed} expired known keys")
+
+    def close(self):
+        """Write all remaining keys and close the database."""
+        with self.lock:
+            self.write_to_disk()
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
+
+    def migrate_legacy_file(self, connection: sqlite3.Connection):
+        """Import the keys from the old toml file into the database.
+
+        The toml file is renamed afterwards, so this only happens once.
+        """
+        if not os.path.exists(legacy_known_ids_path):
+            return
+
+        with open(legacy_known_ids_path, "rb") as file_descriptor:
+            legacy_keys = tomllib.load(file_descriptor)
+
+        now = time.time()
+        rows = [(site, key, now, now) for site, keys in legacy_keys.items() for key in keys]
+        with connection:
+            connection.executemany(
+                """INSERT OR IGNORE INTO known_keys (site, key, first_seen, last_seen)
+                VALUES (?, ?, ?, ?)""",
+                rows,
+            )
+
+        os.rename(legacy_known_ids_path, legacy_known_ids_path + ".migrated")
+        logger.info(f"Migrated {len(rows)} known keys from {legacy_known_ids_path}")
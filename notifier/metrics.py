@@ -0,0 +1,231 @@
+"""Metrics about the scrape pipeline in the prometheus text format.
+
+This is a minimal implementation of counters, gauges and histograms with labels.
+The metrics can be scraped from a local http endpoint and/or written to a text file,
+e.g. for node_exporter's textfile collector.
+"""
+import asyncio
+import os
+import time
+from abc import ABC, abstractmethod
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+
+from notifier.logging import logger
+
+Labels = tuple[tuple[str, str], ...]
+
+
+def _labels(labels: dict[str, str]) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(labels: Labels, extra: tuple[str, str] | None = None) -> str:
+    pairs = list(labels)
+    if extra is not None:
+        pairs.append(extra)
+    if len(pairs) == 0:
+        return ""
+
+    escaped = [
+        (key, value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for key, value in pairs
+    ]
+    return "{" + ",".join(f'{key}="{value}"' for key, value in escaped) + "}"
+
+
+class Metric(ABC):
+    """The base of all metrics."""
+
+    type: str = ""
+
+    def __init__(self, name: str, help: str) -> None:
+        self.name = name
+        self.help = help
+        metrics.append(self)
+
+    @abstractmethod
+    def samples(self) -> Iterator[str]:
+        """The lines of all values in the text format."""
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        lines += self.samples()
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    """A value that only goes up."""
+
+    type = "counter"
+
+    def __init__(self, name: str, help: str) -> None:
+        super().__init__(name, help)
+        self.values: dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = _labels(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self) -> Iterator[str]:
+        for labels, value in self.values.items():
+            yield f"{self.name}{_format_labels(labels)} {value}"
+
+
+class Gauge(Metric):
+    """A value that can go up and down.
+
+    Gauges can also be backed by a function, which is called on each render.
+    """
+
+    type = "gauge"
+
+    def __init__(self, name: str, help: str) -> None:
+        super().__init__(name, help)
+        self.values: dict[Labels, float] = {}
+        self.function: Callable[[], float] | None = None
+
+    def set(self, value: float, **labels: str) -> None:
+        self.values[_labels(labels)] = value
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        self.function = function
+
+    def samples(self) -> Iterator[str]:
+        if self.function is not None:
+            yield f"{self.name} {self.function()}"
+        for labels, value in self.values.items():
+            yield f"{self.name}{_format_labels(labels)} {value}"
+
+
+class Histogram(Metric):
+    """Count observations in buckets."""
+
+    type = "histogram"
+    default_buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+    def __init__(self, name: str, help: str, buckets: tuple[float, ...] = default_buckets):
+        super().__init__(name, help)
+        self.buckets = buckets
+        # The count of each bucket, the sum and the count of all observations by labels.
+        self.values: dict[Labels, tuple[list[int], float, int]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = _labels(labels)
+        if key not in self.values:
+            self.values[key] = ([0] * len(self.buckets), 0.0, 0)
+
+        counts, total, count = self.values[key]
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[index] += 1
+        self.values[key] = (counts, total + value, count + 1)
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        """Observe the duration of a block."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self) -> Iterator[str]:
+        for labels, (counts, total, count) in self.values.items():
+            for bound, bucket_count in zip(self.buckets, counts, strict=True):
+                bucket = _format_labels(labels, ("le", f"{bound:g}"))
+                yield f"{self.name}_bucket{bucket} {bucket_count}"
+            yield f"{self.name}_bucket{_format_labels(labels, ('le', '+Inf'))} {count}"
+            yield f"{self.name}_sum{_format_labels(labels)} {total}"
+            yield f"{self.name}_count{_format_labels(labels)} {count}"
+
+
+metrics: list[Metric] = []
+
+stage_duration = Histogram(
+    "notifier_stage_duration_seconds",
+    "Duration of each stage of the scrape pipeline.",
+)
+pages = Counter(
+    "notifier_pages_total",
+    "Fetched result pages by status (fetched, not_modified, unchanged).",
+)
+offers = Counter(
+    "notifier_offers_total",
+    "Offers by outcome (new, known, filtered, duplicate, sent).",
+)
+filtered_offers = Counter(
+    "notifier_filtered_offers_total",
+    "Offers that have been filtered by the rule that filtered them.",
+)
+scrape_errors = Counter(
+    "notifier_scrape_errors_total",
+    "Failed scrapes by kind (error, timeout, rate_limited).",
+)
+breaker_changes = Counter(
+    "notifier_circuit_breaker_changes_total",
+    "Sites that have been stopped (opened) or recovered (closed) by their circuit breaker.",
+)
+notification_latency = Histogram(
+    "notifier_notification_latency_seconds",
+    "Time between an offer being posted and its notification being sent.",
+    buckets=(30, 60, 120, 300, 600, 1200, 1800, 3600, 7200),
+)
+messages = Counter(
+    "notifier_messages_total",
+    "Sent telegram messages by kind (single, digest).",
+)
+scam_offers = Counter(
+    "notifier_scam_offers_total",
+    "Offers that have been flagged as scams.",
+)
+known_keys_size = Gauge(
+    "notifier_known_keys",
+    "The amount of known keys over all sites and chats.",
+)
+send_queue_depth = Gauge(
+    "notifier_send_queue_depth",
+    "The amount of messages waiting to be sent.",
+)
+
+
+def render() -> str:
+    """Render all metrics in the prometheus text format."""
+    return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+def write_metrics_file(path: str) -> None:
+    """Atomically write all metrics to a file."""
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, "w") as file_descriptor:
+        file_descriptor.write(render())
+    os.replace(temporary_path, path)
+
+
+async def _handle_request(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    """Answer any http request with the current metrics."""
+    try:
+        # Read and ignore the request, we only serve a single thing anyway.
+        while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+            pass
+
+        body = render().encode()
+        writer.write(
+            b"HTTP/1.1 200 OK\r\n"
+            + b"Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+            + f"Content-Length: {len(body)}\r\n".encode()
+            + b"Connection: close\r\n\r\n"
+            + body
+        )
+        await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+async def start_metrics_server(host: str, port: int) -> asyncio.Server:
+    """Serve the metrics via http."""
+    server = await asyncio.start_server(_handle_request, host, port)
+    logger.info(f"Serving metrics on http://{host}:{port}/metrics")
+    return server
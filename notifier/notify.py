@@ -1,45 +1,80 @@
-import time
-
-from telegram import Bot
-from telegram.constants import ParseMode
+from telegram.ext import CallbackContext
 
+from notifier import metrics
 from notifier.apartments.offer import Apartment
+from notifier.apartments.profiles import SearchProfile
+from notifier.apartments.searches import Search
 from notifier.config import config
-from notifier.known_keys import KnownKeys
+from notifier.known_keys import known_keys_site
 from notifier.logging import logger
 
 
-async def send_apartment_offers(bot: Bot, offers: list[Apartment]) -> None:
-    """Get a list of offers and send them.
+async def send_apartment_offers(
+    context: CallbackContext,
+    search: Search,
+    offers: list[Apartment],
+) -> None:
+    """Get a list of offers and send them to all chats that subscribed to a search.
+
+    We do some additional checks in here to only send offers that match the profiles.
+    We also make sure that we don't send offers twice to the same chat, neither by id
+    nor as a duplicate of an offer from another site.
 
-    We do some additional checks in here to only send offers that are viable to us.
-    We also make sure that we don't send offers twice.
+    Offers are only queued for sending, so this returns immediately.
     """
-    known_keys = KnownKeys()
-    known_keys.read_from_disk()
+    known_keys = context.bot_data["known_keys"]
+    send_queue = context.bot_data["send_queue"]
+    duplicates = context.bot_data["duplicates"]
+    duplicate_config = config["duplicates"]
+
+    site_name = search.site.name
+    metrics.offers.inc(len(offers), site=site_name, outcome="new")
+
+    with metrics.stage_duration.time(stage="filter", site=site_name):
+        for offer in offers:
+            original = None
+            if duplicate_config["enabled"]:
+                original = duplicates.find(offer)
 
-    for offer in offers:
-        # Don't send offers twice
-        if known_keys.has_key(offer.source, offer.id):
-            continue
+            # Only look at profiles, whose numeric limits allow this offer.
+            # Multiple profiles may notify the same chat, which is why we group them by chat.
+            # Chats without any such profile still remember the offer as filtered, so it's
+            # known on the next visit.
+            profiles_by_chat: dict[int | str, list[SearchProfile]] = {
+                chat_id: [] for chat_id in search.chat_ids
+            }
+            for profile in search.index.candidates(offer):
+                profiles_by_chat.setdefault(profile.chat_id, []).append(profile)
 
-        # Ignore offers that don't match our criteria
-        if not offer.is_viable():
-            known_keys.add_key(offer.source, offer.id)
-            continue
+            for chat_id, profiles in profiles_by_chat.items():
+                site = known_keys_site(offer.source, chat_id)
 
-        logger.info(f"Sending notification for: {offer.title}")
-        # Send the notification
-        await bot.sendMessage(
-            chat_id=config["telegram"]["target_channel"],
-            text=offer.format(),
-            parse_mode=ParseMode.MARKDOWN,
-            disable_web_page_preview=True,
-        )
+                # Don't send offers twice
+                if known_keys.has_key(site, offer.id):
+                    known_keys.touch(site, offer.id)
+                    metrics.offers.inc(site=site_name, outcome="known")
+                    continue
 
-        time.sleep(2)
+                # Only send offers that match the criteria of any profile
+                if any(profile.is_viable(offer) for profile in profiles):
+                    if original is not None and chat_id in original.chats:
+                        logger.info(f"Found duplicate of {original.key} for: {offer.title}")
+                        metrics.offers.inc(site=site_name, outcome="duplicate")
+                        if duplicate_config["mode"] == "mention":
+                            text = f"[Auch auf {offer.source}]({offer.link}): {original.key[1]}"
+                            send_queue.enqueue(chat_id, text, digest=True)
+                    else:
+                        logger.info(f"Sending notification for: {offer.title}")
+                        # Queue the notification
+                        send_queue.enqueue(
+                            chat_id, offer.format(), posted_at=offer.time, digest=True
+                        )
+                        metrics.offers.inc(site=site_name, outcome="sent")
+                        duplicates.add(offer, chat_id)
+                else:
+                    metrics.offers.inc(site=site_name, outcome="filtered")
 
-        known_keys.add_key(offer.source, offer.id)
-        known_keys.write_to_disk()
+                known_keys.add_key(site, offer.id)
 
+    # Persist all new keys of this batch at once.
     known_keys.write_to_disk()
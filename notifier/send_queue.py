@@ -0,0 +1,291 @@
+"""An outbound queue for all telegram messages.
+
+Scrapers only enqueue their messages and return immediately.
+The actual sending is done by a worker per chat, which respects telegram's rate limits
+and retries messages that failed due to flood control or network problems.
+
+Chats can use a digest mode, in which offers that're waiting to be sent are combined
+into as few messages as possible. This mostly matters during bursts, which would
+otherwise run into telegram's flood control.
+"""
+import asyncio
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+
+from telegram import Bot
+from telegram.constants import ParseMode
+from telegram.error import BadRequest, NetworkError, RetryAfter
+
+from notifier import metrics
+from notifier.config import config
+from notifier.logging import logger
+
+
+@dataclass
+class Message:
+    chat_id: int | str
+    text: str
+    parse_mode: str | None = ParseMode.MARKDOWN
+    # When the thing we notify about has been posted, if it's known.
+    posted_at: datetime | None = None
+    # Whether the message may be combined with others in a digest.
+    digest: bool = False
+    queued_at: float = field(default_factory=time.monotonic)
+    # The messages that have been combined into this one.
+    parts: list["Message"] = field(default_factory=list)
+    attempts: int = 0
+
+
+def digest_options(chat_id: int | str) -> dict:
+    """Get the digest options of a chat, which may override the defaults."""
+    options = dict(config["digest"])
+    overrides = options.pop("chats", {})
+    options.update(overrides.get(str(chat_id), {}))
+
+    return options
+
+
+def combine_messages(messages: list[Message], max_length: int) -> list[Message]:
+    """Combine messages into as few messages as possible.
+
+    Messages are kept in order and each combined message stays within `max_length`.
+    A single message is never split.
+    """
+    separator = "\n\n"
+    # Leave some room for the header.
+    header_length = 32
+
+    groups: list[list[Message]] = []
+    length = header_length
+    for message in messages:
+        added = len(separator) + len(message.text)
+        if len(groups) == 0 or length + added > max_length:
+            groups.append([])
+            length = header_length
+        groups[-1].append(message)
+        length += added
+
+    combined = []
+    for group in groups:
+        if len(group) == 1:
+            combined.append(group[0])
+            continue
+
+        text = f"{len(group)} neue Angebote:" + separator
+        text += separator.join(message.text.strip() for message in group)
+        first = group[0]
+        combined.append(Message(first.chat_id, text, first.parse_mode, parts=group))
+
+    return combined
+
+
+class TokenBucket:
+    """A simple token bucket rate limiter.
+
+    The bucket refills with `rate` tokens per second up to `capacity` tokens.
+    """
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        """Wait until a token is available and take it."""
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds: float) -> None:
+        """Don't hand out any tokens for the given amount of time."""
+        self.tokens = min(self.tokens, 0) - seconds * self.rate
+
+
+class SendQueue:
+    """Queue messages and send them in the background."""
+
+    def __init__(self, bot: Bot) -> None:
+        send_config = config["send_queue"]
+        self.bot = bot
+        self.global_bucket = TokenBucket(send_config["global_rate"], send_config["global_rate"])
+        self.chat_buckets: dict[int | str, TokenBucket] = {}
+        self.queues: dict[int | str, asyncio.Queue[Message]] = {}
+        self.workers: dict[int | str, asyncio.Task] = {}
+
+    def enqueue(
+        self,
+        chat_id: int | str,
+        text: str,
+        parse_mode: str | None = ParseMode.MARKDOWN,
+        posted_at: datetime | None = None,
+        digest: bool = False,
+    ) -> None:
+        """Add a message to the queue of a chat. This never blocks.
+
+        Messages with `digest` may be combined with others, if the chat uses digests.
+        """
+        if chat_id not in self.queues:
+            send_config = config["send_queue"]
+            self.queues[chat_id] = asyncio.Queue()
+            self.chat_buckets[chat_id] = TokenBucket(
+                send_config["chat_rate"],
+                send_config["chat_burst"],
+            )
+            self.workers[chat_id] = asyncio.create_task(self.work(chat_id))
+
+        message = Message(chat_id, text, parse_mode, posted_at, digest)
+        self.queues[chat_id].put_nowait(message)
+
+    def size(self) -> int:
+        """The amount of messages that're waiting to be sent."""
+        return sum(queue.qsize() for queue in self.queues.values())
+
+    async def work(self, chat_id: int | str) -> None:
+        """Send all messages of a single chat."""
+        queue = self.queues[chat_id]
+        while True:
+            messages = [await queue.get()]
+            options = digest_options(chat_id)
+            if options["enabled"] and messages[0].digest:
+                messages += await self.collect(queue, messages[0], options["window"])
+
+            try:
+                # Only combine messages of the same kind.
+                digest = [message for message in messages if message.digest]
+                outgoing = [message for message in messages if not message.digest]
+                if len(digest) >= options["threshold"]:
+                    digest = combine_messages(digest, options["max_length"])
+                outgoing = digest + outgoing
+
+                for message in outgoing:
+                    await self.deliver(message)
+            finally:
+                for _ in messages:
+                    queue.task_done()
+
+    async def deliver(self, message: Message) -> None:
+        """Send a message and log any failure.
+
+        If a digest is rejected, e.g. because one of its offers breaks the markdown,
+        its messages are sent one by one instead, so only that offer is lost.
+        """
+        try:
+            await self.send(message)
+            return
+        except BadRequest as ex:
+            if len(message.parts) == 0:
+                logger.error(f"Failed to send message to {message.chat_id}: {ex}")
+                return
+            logger.warning(f"Failed to send digest to {message.chat_id}, sending it in parts: {ex}")
+        except Exception as ex:
+            logger.error(f"Failed to send message to {message.chat_id}: {ex}")
+            return
+
+        for part in message.parts:
+            try:
+                await self.send(part)
+            except Exception as ex:
+                logger.error(f"Failed to send message to {message.chat_id}: {ex}")
+
+    async def collect(
+        self,
+        queue: asyncio.Queue[Message],
+        first: Message,
+        window: float,
+    ) -> list[Message]:
+        """Take all further messages for a digest from the queue.
+
+        This includes all messages that're already waiting and those that're added
+        within `window` seconds after the first one. Collecting stops at the first
+        message that can't be part of a digest.
+        """
+        deadline = first.queued_at + window
+        collected = []
+        while True:
+            if queue.empty():
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    message = await asyncio.wait_for(queue.get(), timeout)
+                except TimeoutError:
+                    break
+            else:
+                message = queue.get_nowait()
+
+            collected.append(message)
+            if not message.digest:
+                break
+
+        return collected
+
+    async def send(self, message: Message) -> None:
+        """Send a single message, retrying on flood control and network errors."""
+        max_retries = config["send_queue"]["max_retries"]
+        chat_bucket = self.chat_buckets[message.chat_id]
+
+        while True:
+            await chat_bucket.acquire()
+            await self.global_bucket.acquire()
+
+            message.attempts += 1
+            try:
+                with metrics.stage_duration.time(stage="send", site="telegram"):
+                    await self.bot.send_message(
+                        chat_id=message.chat_id,
+                        text=message.text,
+                        parse_mode=message.parse_mode,
+                        disable_web_page_preview=True,
+                    )
+
+                kind = "single" if len(message.parts) == 0 else "digest"
+                metrics.messages.inc(kind=kind)
+                for part in message.parts or [message]:
+                    if part.posted_at is not None:
+                        latency = (datetime.now() - part.posted_at).total_seconds()
+                        metrics.notification_latency.observe(latency)
+                return
+            except RetryAfter as ex:
+                # We hit telegram's flood control. Wait as long as we're told to.
+                retry_after = ex.retry_after
+                if not isinstance(retry_after, int | float):
+                    retry_after = retry_after.total_seconds()
+                logger.warning(f"Hit flood control, retrying in {retry_after}s")
+                chat_bucket.pause(retry_after)
+                delay = 0
+            except BadRequest:
+                # These won't get any better by retrying.
+                raise
+            except NetworkError as ex:
+                # This includes `TimedOut`.
+                delay = 2 ** (message.attempts - 1)
+                logger.warning(f"Got {ex} while sending, retrying in {delay}s")
+
+            if message.attempts > max_retries:
+                raise Exception(f"Giving up after {message.attempts} attempts")
+
+            await asyncio.sleep(delay)
+
+    async def stop(self) -> None:
+        """Try to send all remaining messages and stop all workers."""
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(*[queue.join() for queue in self.queues.values()]),
+                timeout=config["send_queue"]["shutdown_timeout"],
+            )
+        except TimeoutError:
+            logger.warning(f"Dropping {self.size()} unsent messages on shutdown")
+
+        for worker in self.workers.values():
+            worker.cancel()